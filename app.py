@@ -1,36 +1,36 @@
 
 import streamlit as st
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-from utils.mapper import map_columns, infer_flux_pays
-from utils.scorer import enrich_with_existing_scores, json_index
-from utils.file_utils import convert_df_to_excel
-from utils.forecasting import forecast_quantity
+from utils.data_loader import get_loader
+from utils.file_utils import EXPORT_FORMATS, export_bytes
+from utils.pipeline import process_excel, refresh_scores
+from utils.profiling import PROFILE_ENGINES, Profiler, Recorder, stage
 
 st.set_page_config(page_title="AI - Planification d’Inventaire", layout="wide")
 st.title("📦 Outil IA de Planification d’Inventaire")
 
 
 @st.cache_data(show_spinner=False)
-def load_excel(uploaded_file):
-    df = pd.read_excel(uploaded_file)
-    df = df.reset_index(drop=True)  # Ensure a unique, simple index
-    return df
+def load_and_enrich(uploaded_file, _progress=None):
+    # Lecture en streaming (openpyxl read-only) : mapping, scoring et références manquantes bloc par bloc
+    return process_excel(uploaded_file, progress=_progress)
 
-@st.cache_data(show_spinner=False)
-def map_and_enrich(df):
-    df_mapped = map_columns(df)
-    # Ensure unique columns and index after mapping
-    df_mapped = df_mapped.loc[:, ~df_mapped.columns.duplicated()]
-    df_mapped = df_mapped.reset_index(drop=True)
-    if "Pays" in df_mapped.columns:
-        df_mapped["Flux Pièce"] = df_mapped["Pays"].apply(infer_flux_pays)
-    df_final = enrich_with_existing_scores(df_mapped)
-    return df_mapped, df_final
+
+# Un ou deux résultats par fichier suffisent : chaque nouvelle version de critères
+# ou de base remplace l'ancienne au lieu de s'ajouter en mémoire
+@st.cache_data(show_spinner=False, max_entries=2)
+def load_and_score(uploaded_file, criteria_version, reference_version, _progress=None):
+    # Clé de cache : fichier + versions des critères et de la base de référence.
+    # Après une modification, seules les lignes concernées sont recalculées.
+    return refresh_scores(load_and_enrich(uploaded_file, _progress=_progress))
 
 uploaded_file = st.file_uploader("📤 Importer un fichier Excel", type=["xlsx"])
 
+# --- Mesure des performances (optionnelle) : temps, lignes et mémoire par étape ---
+st.sidebar.header("⏱️ Performance")
+measure_performance = st.sidebar.checkbox("Mesurer les étapes", value=False)
+profile_engine = st.sidebar.selectbox("Profilage de l'exécution", ["Aucun"] + PROFILE_ENGINES)
 
 
 if uploaded_file:
@@ -38,141 +38,203 @@ if uploaded_file:
     if not uploaded_file:
         st.info("Veuillez importer un fichier Excel contenant au moins 2 dates valides et quantités par produit pour activer la prévision.")
         st.stop()
+    recorder = Recorder().start() if measure_performance else None
+    profiler = None
+    if profile_engine != "Aucun":
+        try:
+            profiler = Profiler(profile_engine).start()
+        except (ImportError, ValueError) as e:
+            # ValueError : un autre profileur est déjà actif dans le processus (Python ≥ 3.12)
+            st.sidebar.warning(str(e))
+    # Arrêt garanti même si Streamlit interrompt l'exécution (clic pendant un calcul, st.stop)
     try:
-        df = load_excel(uploaded_file)
-    except Exception as e:
-        st.error(f"Erreur lors du chargement du fichier : {e}")
-        st.stop()
-
-    st.subheader("🔍 Aperçu du fichier importé")
-    st.dataframe(df.head(20))
+        progress_bar = st.progress(0.0, text="Lecture du fichier…")
 
-    try:
-        df_mapped, df_final = map_and_enrich(df)
-    except Exception as e:
-        st.error(f"Erreur lors du mapping ou de l'enrichissement : {e}")
-        st.stop()
+        def show_progress(done, total):
+            ratio = min(done / total, 1.0) if total else 0.0
+            progress_bar.progress(ratio, text=f"{done} ligne(s) traitée(s)")
 
-    # --- Sidebar Filtering ---
-    st.sidebar.header("🔎 Filtres")
-    filter_df = df_final.copy()
-    # Filter by Produit
-    if "Produit" in filter_df.columns:
-        produits = filter_df["Produit"].dropna().unique().tolist()
-        selected_produits = st.sidebar.multiselect("Produit", produits)
-        if selected_produits:
-            filter_df = filter_df[filter_df["Produit"].isin(selected_produits)]
-    # Filter by Pays
-    if "Pays" in filter_df.columns:
-        pays = filter_df["Pays"].dropna().unique().tolist()
-        selected_pays = st.sidebar.multiselect("Pays", pays)
-        if selected_pays:
-            filter_df = filter_df[filter_df["Pays"].isin(selected_pays)]
-    # Filter by Catégorie
-    if "Catégorie" in filter_df.columns:
-        categories = filter_df["Catégorie"].dropna().unique().tolist()
-        selected_categories = st.sidebar.multiselect("Catégorie", categories)
-        if selected_categories:
-            filter_df = filter_df[filter_df["Catégorie"].isin(selected_categories)]
-    # Filter by Date du dernier RI (as a date range)
-    if "Date du dernier RI" in filter_df.columns:
         try:
-            filter_df["Date du dernier RI"] = pd.to_datetime(filter_df["Date du dernier RI"], errors='coerce')
-            min_date = filter_df["Date du dernier RI"].min()
-            max_date = filter_df["Date du dernier RI"].max()
-            date_range = st.sidebar.date_input("Date du dernier RI (plage)", [min_date, max_date])
-            if len(date_range) == 2:
-                filter_df = filter_df[(filter_df["Date du dernier RI"] >= pd.to_datetime(date_range[0])) & (filter_df["Date du dernier RI"] <= pd.to_datetime(date_range[1]))]
-        except Exception:
-            pass
-
-    # --- Dashboard Summary ---
-    col1, col2, col3, col4 = st.columns(4)
-    with col1:
-        st.metric("Total produits", len(df_final))
-    with col2:
-        st.metric("Références manquantes", sum([str(row.get('Produit', '')).strip() not in json_index for _, row in df_mapped.iterrows()]))
-    with col3:
-        st.metric("Colonnes", len(df_final.columns))
-    with col4:
-        st.metric("Valeurs manquantes", int(df_final.isna().sum().sum()))
-
-    st.success("✅ Résultat enrichi avec score intelligent")
-    st.dataframe(filter_df.head(50))
-
-    # Anomaly Detection Option
-    st.subheader("🔎 Détection d'anomalies (AI)")
-    if st.button("Détecter les anomalies dans les données"):
-        from utils.anomaly_detection import detect_anomalies
-        features = [col for col in ["Quantité", "Prix Pièce", "UC"] if col in df_final.columns]
-        if not features:
-            st.warning("Aucune colonne numérique pertinente trouvée pour la détection d'anomalies.")
-        else:
-            try:
-                df_anom = detect_anomalies(df_final, features=features)
-                n_anom = (df_anom['anomaly'] == -1).sum()
-                st.info(f"{n_anom} anomalie(s) détectée(s) sur {len(df_anom)} lignes.")
-                st.dataframe(df_anom[df_anom['anomaly'] == -1].head(50))
-
-                # Show distribution and anomaly graphs
-                for feat in features:
-                    fig, ax = plt.subplots()
-                    sns.histplot(df_anom[feat], kde=True, color='blue', label='Normal', ax=ax)
-                    if (df_anom['anomaly'] == -1).any():
-                        sns.histplot(df_anom[df_anom['anomaly'] == -1][feat], color='red', label='Anomalie', ax=ax)
-                    ax.set_title(f"Distribution de {feat} (anomalies en rouge)")
-                    ax.legend()
-                    st.pyplot(fig)
-            except Exception as e:
-                st.error(f"Erreur lors de la détection d'anomalies : {e}")
-
-    # Add Reference Button for missing products
-    missing_refs = [idx for idx, row in df_mapped.iterrows() if str(row.get("Produit", "")).strip() and str(row.get("Produit", "")).strip() not in json_index]
-
-    if missing_refs:
-        st.warning(f"{len(missing_refs)} référence(s) non trouvée(s) dans la base de données.")
-        st.markdown("**Détails des références manquantes :**")
-        st.dataframe(df_mapped.loc[missing_refs].head(20))
-        if st.button("Ajouter les références manquantes dans la base JSON"):
-            from utils.add_reference import add_reference
-            added = 0
-            for idx in missing_refs:
-                row = df_mapped.loc[idx].to_dict()
-                for k, v in row.items():
-                    if pd.isna(v):
-                        row[k] = ""
+            # Étapes internes mesurées seulement si le résultat n'est pas déjà en cache
+            with stage("Chargement et enrichissement"):
+                loader = get_loader()
+                criteria_version, reference_version = loader.criteria.version, loader.references.version
+                preview, df_mapped, df_final, missing, memory, _ = load_and_score(
+                    uploaded_file, criteria_version, reference_version, _progress=show_progress
+                )
+                # Identifie le résultat sans le hacher : mêmes arguments que load_and_score
+                file_id = getattr(uploaded_file, "file_id", None) or f"{uploaded_file.name}:{uploaded_file.size}"
+                result_key = f"{file_id}|{criteria_version}|{reference_version}"
+        except Exception as e:
+            st.error(f"Erreur lors du chargement, du mapping ou de l'enrichissement : {e}")
+            st.stop()
+        progress_bar.empty()
+
+        st.subheader("🔍 Aperçu du fichier importé")
+        st.dataframe(preview)
+
+        # --- Sidebar Filtering (masques booléens, sans copie du tableau) ---
+        st.sidebar.header("🔎 Filtres")
+        with stage("Filtres", rows=len(df_final)):
+            mask = np.ones(len(df_final), dtype=bool)
+            # Filter by Produit, Pays, Catégorie (options limited to the rows still selected)
+            for col in ["Produit", "Pays", "Catégorie"]:
+                if col in df_final.columns:
+                    options = df_final.loc[mask, col].dropna().unique().tolist()
+                    selected = st.sidebar.multiselect(col, options)
+                    if selected:
+                        mask &= df_final[col].isin(selected).to_numpy()
+            # Filter by Date du dernier RI (as a date range)
+            if "Date du dernier RI" in df_final.columns:
+                try:
+                    dates = df_final["Date du dernier RI"]
+                    min_date = dates[mask].min()
+                    max_date = dates[mask].max()
+                    date_range = st.sidebar.date_input("Date du dernier RI (plage)", [min_date, max_date])
+                    if len(date_range) == 2:
+                        mask &= ((dates >= pd.to_datetime(date_range[0])) & (dates <= pd.to_datetime(date_range[1]))).to_numpy()
+                except Exception:
+                    pass
+        if memory:
+            st.sidebar.caption(
+                f"Mémoire du résultat : {memory['avant'] / 1e6:.1f} Mo → {memory['après'] / 1e6:.1f} Mo"
+            )
+
+        # --- Dashboard Summary ---
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("Total produits", len(df_final))
+        with col2:
+            st.metric("Références manquantes", int(missing.sum()))
+        with col3:
+            st.metric("Colonnes", len(df_final.columns))
+        with col4:
+            st.metric("Valeurs manquantes", int(df_final.isna().sum().sum()))
+
+        st.success("✅ Résultat enrichi avec score intelligent")
+        st.dataframe(df_final.iloc[np.flatnonzero(mask)[:50]])
+
+        # Anomaly Detection Option
+        st.subheader("🔎 Détection d'anomalies (AI)")
+        if st.button("Détecter les anomalies dans les données"):
+            # Imports lourds (scikit-learn, matplotlib) seulement à la demande
+            import matplotlib.pyplot as plt
+            import seaborn as sns
+            from utils.anomaly_detection import detect_anomalies
+            features = [col for col in ["Quantité", "Prix Pièce", "UC"] if col in df_final.columns]
+            if not features:
+                st.warning("Aucune colonne numérique pertinente trouvée pour la détection d'anomalies.")
+            else:
                 try:
-                    add_reference(row)
-                    added += 1
+                    # Résultat séparé : df_final (en cache) n'est pas modifié
+                    result = detect_anomalies(df_final, features=features)
+                    is_anom = result.labels == -1
+                    n_anom = int(is_anom.sum())
+                    st.info(f"{n_anom} anomalie(s) détectée(s) sur {len(df_final)} lignes.")
+                    anom_rows = np.flatnonzero(is_anom)[:50]
+                    st.dataframe(df_final.iloc[anom_rows].assign(**{"Score d'anomalie": result.scores[anom_rows]}))
+
+                    # Show distribution and anomaly graphs
+                    with stage("Graphiques d'anomalies", rows=len(df_final)):
+                        for feat in features:
+                            fig, ax = plt.subplots()
+                            sns.histplot(df_final[feat], kde=True, color='blue', label='Normal', ax=ax)
+                            if n_anom:
+                                sns.histplot(df_final.loc[is_anom, feat], color='red', label='Anomalie', ax=ax)
+                            ax.set_title(f"Distribution de {feat} (anomalies en rouge)")
+                            ax.legend()
+                            st.pyplot(fig)
+                except Exception as e:
+                    st.error(f"Erreur lors de la détection d'anomalies : {e}")
+
+        # Add Reference Button for missing products
+        # Masque calculé une seule fois dans load_and_enrich (mis en cache)
+        missing_refs = df_mapped.index[missing]
+
+        if len(missing_refs):
+            st.warning(f"{len(missing_refs)} référence(s) non trouvée(s) dans la base de données.")
+            st.markdown("**Détails des références manquantes :**")
+            st.dataframe(df_mapped.loc[missing_refs].head(20))
+            if st.button("Ajouter les références manquantes dans la base JSON"):
+                from utils.add_reference import add_references
+                rows = df_mapped.loc[missing_refs].astype(object)
+                rows = rows.where(rows.notna(), "").to_dict(orient="records")
+                try:
+                    with stage("add_references", rows=len(rows)):
+                        added = add_references(rows)
+                    st.success(f"{added} référence(s) ajoutée(s) à la base JSON.")
                 except Exception as e:
                     st.error(f"Erreur lors de l'ajout de la référence : {e}")
-            st.success(f"{added} référence(s) ajoutée(s) à la base JSON.")
-
-    excel_bytes = convert_df_to_excel(df_final)
-    st.download_button(
-        label="📥 Télécharger Résultat Excel",
-        data=excel_bytes,
-        file_name="résultat_inventaire.xlsx",
-        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    )
-
-    # --- Forecasting Feature ---
-    st.subheader("📈 Prévision de la demande (AI)")
-    if st.button("Lancer la prévision de la demande (Prophet)"):
-        try:
-            # Use only products with enough data
-            results, skipped = forecast_quantity(df_final)
-            if not results:
-                st.info("Pas assez de données pour la prévision.")
-            else:
-                for produit, forecast in results.items():
-                    st.markdown(f"**Prévision pour {produit}:**")
-                    st.write(f"Shape: {forecast.shape}, Columns: {forecast.columns.tolist()}")
-                    st.dataframe(forecast.head(24))
-                    st.line_chart(forecast.set_index("ds")["yhat"])
-            if skipped:
-                st.warning(f"Produits ignorés pour la prévision:")
-                for produit, reason in skipped:
-                    st.write(f"- {produit}: {reason}")
-        except Exception as e:
-            st.error(f"Erreur lors de la prévision : {e}")
+
+        # --- Export (généré seulement à la demande, pour ce résultat et ce format) ---
+        st.subheader("📥 Export du résultat")
+        export_format = st.radio("Format", list(EXPORT_FORMATS), horizontal=True)
+        if st.button("Préparer le fichier à télécharger"):
+            st.session_state["export_request"] = (result_key, export_format)
+        # Nouveau fichier, nouvelle version des critères ou de la base : demande oubliée
+        if st.session_state.get("export_request") == (result_key, export_format):
+            _, mime, extension = EXPORT_FORMATS[export_format]
+            try:
+                st.download_button(
+                    label=f"📥 Télécharger Résultat ({extension})",
+                    data=export_bytes(df_final, export_format, fingerprint=result_key),
+                    file_name=f"résultat_inventaire.{extension}",
+                    mime=mime
+                )
+            except Exception as e:
+                st.error(f"Erreur lors de l'export : {e}")
+
+        # --- Forecasting Feature ---
+        st.subheader("📈 Prévision de la demande (AI)")
+        if st.button("Lancer la prévision de la demande (Prophet)"):
+            from utils.forecasting import iter_forecasts
+            try:
+                # Use only products with enough data; results are shown as each fit completes
+                with stage("Prévision (Prophet)", rows=len(df_final)):
+                    n_produits = df_final["Produit"].nunique()
+                    progress = st.progress(0.0)
+                    done = 0
+                    skipped = []
+                    for result in iter_forecasts(df_final):
+                        done += 1
+                        progress.progress(done / max(n_produits, 1))
+                        produit, forecast = result.produit, result.forecast
+                        if forecast is None:
+                            skipped.append((produit, result.error))
+                            continue
+                        st.markdown(f"**Prévision pour {produit}:**")
+                        st.caption(f"Moteur : {result.engine} ({result.seconds:.2f} s)")
+                        st.write(f"Shape: {forecast.shape}, Columns: {forecast.columns.tolist()}")
+                        st.dataframe(forecast.head(24))
+                        st.line_chart(forecast.set_index("ds")["yhat"])
+                if done == len(skipped):
+                    st.info("Pas assez de données pour la prévision.")
+                if skipped:
+                    st.warning(f"Produits ignorés pour la prévision:")
+                    for produit, reason in skipped:
+                        st.write(f"- {produit}: {reason}")
+            except Exception as e:
+                st.error(f"Erreur lors de la prévision : {e}")
+    finally:
+        if profiler is not None:
+            profiler.stop()
+        if recorder is not None:
+            recorder.stop()
+
+    # --- Performance : une ligne par étape de cette exécution, trace de profilage à la demande ---
+    if recorder is not None or profiler is not None:
+        with st.expander("⏱️ Performance"):
+            if recorder is not None:
+                timings = recorder.to_frame()
+                if timings.empty:
+                    st.info("Aucune étape mesurée pendant cette exécution.")
+                else:
+                    st.dataframe(timings)
+                    st.caption("Mémoire : variation de la mémoire résidente du processus pendant l'étape.")
+            if profiler is not None:
+                st.text(profiler.summary())
+                st.download_button(
+                    label=f"Télécharger la trace ({profiler.extension})",
+                    data=profiler.dump(),
+                    file_name=f"profil_inventaire.{profiler.extension}",
+                )
@@ -0,0 +1,90 @@
+"""
+Temps d'import à froid des modules de l'application : python -m benchmarks.import_time
+
+Chaque module est importé dans un interpréteur neuf (plusieurs répétitions, on
+garde la meilleure). Le benchmark échoue (code de sortie 1) si un module dépasse
+son budget ou si l'import charge une bibliothèque lourde qui ne doit l'être qu'à
+l'usage (prophet, scikit-learn, matplotlib, seaborn).
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Budget (secondes) par module, pandas/numpy compris
+BUDGETS = {
+    "utils.criteria": 1.0,
+    "utils.scorer": 1.5,
+    "utils.pipeline": 2.0,
+    "utils.forecasting": 1.5,
+    "utils.anomaly_detection": 1.5,
+    "utils.__main__": 2.0,
+}
+HEAVY_MODULES = ["prophet", "sklearn", "matplotlib", "seaborn", "cmdstanpy"]
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+heavy = sorted(name for name in {heavy!r} if name in sys.modules)
+print(json.dumps({{"seconds": seconds, "heavy": heavy}}))
+"""
+
+
+def measure(module, repeat=3):
+    """Best cold import time of `module` over `repeat` fresh interpreters."""
+    best = None
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, "-c", _PROBE.format(module=module, heavy=HEAVY_MODULES)],
+            cwd=ROOT, capture_output=True, text=True, check=True,
+        ).stdout
+        result = json.loads(out.strip().splitlines()[-1])
+        if best is None or result["seconds"] < best["seconds"]:
+            best = result
+    return best
+
+
+def run(modules=None, repeat=3, scale=1.0):
+    results = []
+    for module in modules or BUDGETS:
+        result = measure(module, repeat)
+        budget = BUDGETS.get(module, max(BUDGETS.values())) * scale
+        results.append({
+            "module": module,
+            "seconds": round(result["seconds"], 4),
+            "budget": budget,
+            "heavy_imports": result["heavy"],
+            "ok": result["seconds"] <= budget and not result["heavy"],
+        })
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.import_time", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("modules", nargs="*", help="modules à mesurer (défaut : tous ceux qui ont un budget)")
+    parser.add_argument("-n", "--repeat", type=int, default=3, help="imports à froid par module")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplicateur des budgets (machines lentes)")
+    parser.add_argument("-o", "--output", help="fichier JSON des résultats (défaut : sortie standard)")
+    args = parser.parse_args(argv)
+
+    results = run(args.modules, args.repeat, args.scale)
+    report = json.dumps({"python": sys.version.split()[0], "results": results}, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report)
+    else:
+        print(report)
+    for r in results:
+        if not r["ok"]:
+            print(f"[régression] {r['module']} : {r['seconds']:.3f} s (budget {r['budget']} s), "
+                  f"imports lourds : {', '.join(r['heavy_imports']) or 'aucun'}", file=sys.stderr)
+    return 0 if all(r["ok"] for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,268 @@
+"""
+Benchmark des étapes du pipeline : python -m benchmarks.pipeline
+
+Génère des plannings synthétiques (mêmes colonnes que l'export de planning,
+mêlant produits présents dans la base de référence et produits inconnus), puis
+mesure séparément chaque étape : temps (meilleur de `repeat` exécutions) et pic
+mémoire (tracemalloc, exécution dédiée). Les résultats sont écrits en JSON ; avec
+--baseline, ils sont comparés à un run précédent et le code de sortie vaut 1 en
+cas de régression.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from utils.anomaly_detection import detect_anomalies
+from utils.data_loader import get_loader, set_data_dir
+from utils.dates import REFERENCE_DATE_FORMAT, normalize_date_column
+from utils.file_utils import convert_df_to_excel
+from utils.forecasting import forecast_quantity
+from utils.mapper import map_columns
+from utils.scorer import calculate_scores, enrich_with_existing_scores
+
+SIZES = [1_000, 10_000, 100_000, 1_000_000]
+STAGES = [
+    "map_columns",
+    "enrich_with_existing_scores",
+    "calculate_scores",
+    "detect_anomalies",
+    "forecast_quantity",
+    "convert_df_to_excel",
+]
+ANOMALY_FEATURES = ["Quantité", "Prix Pièce", "UC"]
+
+PAYS = ["France", "Allemagne", "Espagne", "Portugal", "Pologne", "Chine", "Mexique", "Maroc", None]
+EMBALLAGES = ["PC", "GV", "CT", None]
+DIVERSITES = ["VIS", "VITE", "ECROU", "RONDELLE", "JOINT", "AGRAFE"]
+
+
+def generate_planning(rows, known_ratio=0.5, rows_per_product=20, seed=0, references=None):
+    """
+    Synthetic planning frame (raw column names, before map_columns).
+    Args:
+        rows: number of rows
+        known_ratio: share of rows whose Produit is in the reference base
+        rows_per_product: average number of rows (dates) per unknown product
+        seed: random seed, the same arguments always give the same frame
+        references: known products to draw from (default: the loader's store)
+    """
+    rng = np.random.default_rng(seed)
+    if references is None:
+        references = list(get_loader().references)
+    references = np.asarray(references, dtype=object)
+
+    known = rng.random(rows) < known_ratio if len(references) else np.zeros(rows, dtype=bool)
+    n_unknown = max(1, int((~known).sum()) // max(rows_per_product, 1))
+    unknown_pool = np.array([f"9{i:09d}" for i in range(n_unknown)], dtype=object)
+    produits = np.empty(rows, dtype=object)
+    produits[known] = references[rng.integers(0, len(references), int(known.sum()))] if known.any() else []
+    produits[~known] = unknown_pool[rng.integers(0, n_unknown, int((~known).sum()))]
+
+    # Dates au format du fichier de référence ("19/02/2025 12:05:27"), sur un an
+    end = pd.Timestamp.today().normalize()
+    dates = end - pd.to_timedelta(rng.integers(0, 365 * 24 * 3600, rows), unit="s")
+
+    diversites = np.array(DIVERSITES, dtype=object)[rng.integers(0, len(DIVERSITES), rows)]
+    return pd.DataFrame({
+        "Produit": produits,
+        "Désignation": diversites + " " + rng.integers(100, 999, rows).astype(str),
+        "Diversité": diversites,
+        "Date dernier RI": dates.strftime(REFERENCE_DATE_FORMAT),
+        "Qté": rng.integers(0, 500, rows),
+        "Prix Pièce": rng.lognormal(1.5, 2.0, rows).round(4),
+        "UC": rng.integers(1, 6000, rows),
+        "Pays": np.array(PAYS, dtype=object)[rng.integers(0, len(PAYS), rows)],
+        "Type d'emballage": np.array(EMBALLAGES, dtype=object)[rng.integers(0, len(EMBALLAGES), rows)],
+        "ECV/COR": rng.integers(0, 9, rows),
+        "Rebut Quantité": rng.integers(0, 1500, rows),
+        "Pièces en suspicion de vol": np.where(rng.random(rows) < 0.05, "Oui", "Non"),
+    })
+
+
+def _stage_inputs(raw):
+    # Entrées de chaque étape, préparées hors mesure comme dans map_and_enrich
+    mapped = map_columns(raw).reset_index(drop=True)
+    normalize_date_column(mapped)
+    enriched = enrich_with_existing_scores(mapped.copy())
+    return mapped, enriched
+
+
+def _stage_callables(raw, mapped, enriched, forecast_engine, workers):
+    # Chaque étape reçoit sa propre copie : enrich/calculate complètent le tableau en place
+    features = [col for col in ANOMALY_FEATURES if col in enriched.columns]
+    return {
+        "map_columns": (lambda: raw.copy(), map_columns),
+        "enrich_with_existing_scores": (lambda: mapped.copy(), enrich_with_existing_scores),
+        "calculate_scores": (lambda: mapped.copy(), calculate_scores),
+        "detect_anomalies": (
+            lambda: enriched,
+            lambda df: detect_anomalies(df, features=features, model_dir=None),
+        ),
+        "forecast_quantity": (
+            lambda: enriched,
+            lambda df: forecast_quantity(df, max_workers=workers, cache=None, engine=forecast_engine),
+        ),
+        "convert_df_to_excel": (lambda: enriched, convert_df_to_excel),
+    }
+
+
+def measure(make_input, func, repeat=1, memory=True):
+    """Best wall time over `repeat` runs and, with `memory`, peak traced memory of one extra run."""
+    best = None
+    for _ in range(repeat):
+        data = make_input()
+        gc.collect()
+        start = time.perf_counter()
+        func(data)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+        del data
+    peak = None
+    if memory:
+        data = make_input()
+        gc.collect()
+        tracemalloc.start()
+        try:
+            func(data)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return best, peak
+
+
+def run(sizes=SIZES, stages=STAGES, known_ratio=0.5, rows_per_product=20, repeat=1, memory=True,
+        forecast_engine="auto", workers=None, seed=0, workbook_dir=None, progress=None):
+    """Benchmark every stage at every size; returns a list of result dicts."""
+    references = list(get_loader().references)
+    results = []
+    for rows in sizes:
+        raw = generate_planning(rows, known_ratio, rows_per_product, seed, references)
+        if workbook_dir:
+            os.makedirs(workbook_dir, exist_ok=True)
+            with open(os.path.join(workbook_dir, f"planning_{rows}.xlsx"), "wb") as f:
+                f.write(convert_df_to_excel(raw))
+        mapped, enriched = _stage_inputs(raw)
+        callables = _stage_callables(raw, mapped, enriched, forecast_engine, workers)
+        for stage in stages:
+            make_input, func = callables[stage]
+            seconds, peak = measure(make_input, func, repeat, memory)
+            result = {
+                "rows": rows,
+                "stage": stage,
+                "seconds": round(seconds, 4),
+                "rows_per_second": round(rows / seconds) if seconds else None,
+                "peak_mb": round(peak / 1e6, 2) if peak is not None else None,
+            }
+            results.append(result)
+            if progress:
+                progress(result)
+        del raw, mapped, enriched
+    return results
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, tolerance=0.25, min_seconds=0.05):
+    """
+    Regressions of `results` against `baseline` (same rows and stage): time or
+    peak memory above baseline * (1 + tolerance). Timings shorter than
+    `min_seconds` in both runs are too noisy to compare.
+    """
+    previous = {(r["rows"], r["stage"]): r for r in baseline}
+    regressions = []
+    for r in results:
+        old = previous.get((r["rows"], r["stage"]))
+        if old is None:
+            continue
+        if max(r["seconds"], old["seconds"]) >= min_seconds and r["seconds"] > old["seconds"] * (1 + tolerance):
+            regressions.append({**r, "metric": "seconds", "baseline": old["seconds"], "current": r["seconds"]})
+        if r.get("peak_mb") and old.get("peak_mb") and r["peak_mb"] > old["peak_mb"] * (1 + tolerance):
+            regressions.append({**r, "metric": "peak_mb", "baseline": old["peak_mb"], "current": r["peak_mb"]})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.pipeline", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="nombres de lignes à générer")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES, help="étapes à mesurer")
+    parser.add_argument("--known-ratio", type=float, default=0.5, help="part des lignes dont le produit est dans la base de référence")
+    parser.add_argument("--rows-per-product", type=int, default=20, help="lignes (dates) par produit inconnu")
+    parser.add_argument("-n", "--repeat", type=int, default=1, help="exécutions mesurées par étape (meilleur temps)")
+    parser.add_argument("--no-memory", action="store_true", help="ne pas mesurer le pic mémoire")
+    parser.add_argument("--forecast-engine", choices=["auto", "prophet", "fast"], default="auto", help="moteur de prévision")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="processus pour la prévision")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", default=None, help="dossier de données (critères, base de référence)")
+    parser.add_argument("--workbook-dir", default=None, help="écrire aussi les classeurs générés dans ce dossier")
+    parser.add_argument("-o", "--output", help="fichier JSON des résultats (défaut : sortie standard)")
+    parser.add_argument("--baseline", help="résultats JSON d'un run précédent à comparer")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="hausse tolérée par rapport à la référence (0.25 = +25 %%)")
+    args = parser.parse_args(argv)
+    if args.data_dir:
+        set_data_dir(args.data_dir)
+
+    def show(result):
+        peak = f", pic {result['peak_mb']} Mo" if result["peak_mb"] is not None else ""
+        print(f"{result['rows']:>9} lignes  {result['stage']:<28} {result['seconds']:>9.3f} s{peak}", file=sys.stderr)
+
+    params = {
+        "sizes": args.sizes,
+        "stages": args.stages,
+        "known_ratio": args.known_ratio,
+        "rows_per_product": args.rows_per_product,
+        "repeat": args.repeat,
+        "forecast_engine": args.forecast_engine,
+        "workers": args.workers,
+        "seed": args.seed,
+    }
+    results = run(
+        args.sizes, args.stages, args.known_ratio, args.rows_per_product, args.repeat, not args.no_memory,
+        args.forecast_engine, args.workers, args.seed, args.workbook_dir, progress=show,
+    )
+    report = {
+        "meta": {
+            "date": pd.Timestamp.now().isoformat(timespec="seconds"),
+            "revision": _git_revision(),
+            "python": sys.version.split()[0],
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "params": params,
+        },
+        "results": results,
+    }
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            report["regressions"] = compare(results, json.load(f)["results"], args.tolerance)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    for r in report.get("regressions", []):
+        print(f"[régression] {r['rows']} lignes, {r['stage']} : {r['metric']} {r['baseline']} → {r['current']}", file=sys.stderr)
+    return 1 if report.get("regressions") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
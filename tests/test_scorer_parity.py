@@ -0,0 +1,196 @@
+"""
+Parity of the vectorized calculate_scores with the former per-row implementation
+(iterrows + get_pond_and_coeff), kept here as the reference.
+"""
+import json
+import os
+import re
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.criteria import CompiledCriteria
+from utils.scorer import calculate_scores
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+
+# Règles qui se chevauchent, pour vérifier la priorité à la première correspondance
+OVERLAPPING = {
+    "Critère": "Chevauchement",
+    "Coefficient": 0.3,
+    "Spécifications": [
+        {"Spécification": "> 5", "Pondération": 1},
+        {"Spécification": "1 à 10", "Pondération": 2},
+        {"Spécification": ">=10 & <20", "Pondération": 3},
+        {"Spécification": "< 1", "Pondération": 4},
+        {"Spécification": " Oui ", "Pondération": 5},
+        {"Spécification": ">= 20", "Pondération": 6},
+    ],
+}
+
+
+# --- Implémentation d'origine (ligne par ligne)
+def legacy_parse_interval(condition):
+    condition = condition.strip()
+
+    if ">=" in condition and "<" in condition and "&" in condition:
+        match = re.findall(r"\d+", condition)
+        if len(match) == 2:
+            a, b = map(float, match)
+            return lambda v: float(a) <= float(v) < float(b)
+
+    if "à" in condition:
+        match = re.findall(r"\d+", condition)
+        if len(match) == 2:
+            a, b = map(float, match)
+            return lambda v: a <= float(v) <= b
+
+    if condition.startswith(">="):
+        match = re.findall(r"\d+", condition)
+        if match:
+            return lambda v: float(v) >= float(match[0])
+
+    if condition.startswith("<"):
+        match = re.findall(r"\d+", condition)
+        if match:
+            return lambda v: float(v) < float(match[0])
+
+    if condition.startswith(">"):
+        match = re.findall(r"\d+", condition)
+        if match:
+            return lambda v: float(v) > float(match[0])
+
+    return lambda v: str(v).strip().lower() == condition.strip().lower()
+
+
+def legacy_get_pond_and_coeff(value, critere, criteria):
+    for c in criteria:
+        if c["Critère"] == critere:
+            for spec in c["Spécifications"]:
+                try:
+                    if legacy_parse_interval(spec["Spécification"])(value):
+                        return spec["Pondération"], c["Coefficient"]
+                except Exception:
+                    continue
+    return 0, 0
+
+
+def legacy_calculate_scores(df, criteria):
+    scores = []
+    categories = []
+    statuts = []
+    today = pd.Timestamp(datetime.today().date())
+
+    for idx, row in df.iterrows():
+        total = 0
+        for c in criteria:
+            crit = c["Critère"]
+            if crit in row and pd.notna(row[crit]):
+                value = row[crit]
+                if crit == "Date du dernier RI":
+                    try:
+                        value = (today - pd.to_datetime(value)).days
+                    except Exception:
+                        value = 0
+                pond, coeff = legacy_get_pond_and_coeff(value, crit, criteria)
+                total += pond * coeff
+
+        scores.append(round(total, 2))
+        if total >= 16:
+            categories.append("Haut")
+        elif total >= 13:
+            categories.append("Moyen")
+        elif total > 0:
+            categories.append("Bas")
+        else:
+            categories.append("Non pondéré")
+        if total <= 10:
+            statuts.append("Urgent")
+        elif total < 16:
+            statuts.append("Normal")
+        else:
+            statuts.append("Safe")
+
+    df["Score Calculé"] = scores
+    df["Catégorie"] = categories
+    df["Statut Inventaire"] = statuts
+    return df
+
+
+# --- Données
+@pytest.fixture(scope="module")
+def criteria():
+    with open(os.path.join(DATA_DIR, "critere.json"), encoding="utf-8") as f:
+        return json.load(f) + [OVERLAPPING]
+
+
+@pytest.fixture(scope="module")
+def compiled(criteria):
+    return CompiledCriteria(criteria)
+
+
+def _values(rng, n, choices):
+    pool = np.empty(len(choices), dtype=object)
+    pool[:] = choices
+    return pool[rng.integers(0, len(choices), n)]
+
+
+def random_frame(rng, n):
+    today = pd.Timestamp(datetime.today().date())
+    # Bords des intervalles, à ±0.5 près, et valeurs texte
+    edges = [0, 0.5, 1, 1.5, 2, 3, 5, 9.99, 10, 10.5, 36, 37, 50, 51, 72, 100, 180, 200, 500, 501,
+             515, 516, 688, 860, 1072, 1073, 4000, 4001, -3]
+    numbers = edges + [str(e) for e in edges[:8]] + ["12", " 12 ", "abc", "", None, np.nan]
+    labels = ["GV", "gv", " GV ", "PC", "pc ", "Pc", "Local", "local", "Ibérique", "PECO", " peco",
+              "Overseas", "Europe Ouest &Central", "Oui", "oui", " OUI", "Non", "non ", "autre", 12, None, np.nan]
+    days = [0, 1, 20, 36, 37, 72, 73, 108, 109, 144, 145, 180, 181, 400]
+    dates = [today - pd.Timedelta(days=int(d)) for d in days] + [pd.NaT, None]
+    return pd.DataFrame({
+        "Type d'emballage": _values(rng, n, labels),
+        "Flux Pièce": _values(rng, n, labels),
+        "Date du dernier RI": _values(rng, n, dates),
+        "Prix Pièce": _values(rng, n, numbers),
+        "ECV/COR": _values(rng, n, numbers),
+        "UC": _values(rng, n, numbers),
+        "Rebut": _values(rng, n, numbers),
+        "Pièces en suspicion de vol": _values(rng, n, labels),
+        "Chevauchement": _values(rng, n, numbers + labels),
+    })
+
+
+SCORE_COLUMNS = ["Score Calculé", "Catégorie", "Statut Inventaire"]
+
+
+def _assert_parity(df, criteria, compiled):
+    expected = legacy_calculate_scores(df.copy(), criteria)
+    actual = calculate_scores(df.copy(), compiled=compiled)
+    for col in SCORE_COLUMNS:
+        assert actual[col].tolist() == expected[col].tolist(), col
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_parity_on_random_mixed_frames(criteria, compiled, seed):
+    rng = np.random.default_rng(seed)
+    _assert_parity(random_frame(rng, 600), criteria, compiled)
+
+
+def test_parity_on_typed_columns(criteria, compiled):
+    rng = np.random.default_rng(42)
+    df = random_frame(rng, 400)
+    df["Prix Pièce"] = rng.choice([0.5, 1.0, 9.99, 10.0, 99.5, 100.0, 500.0, np.nan], 400)
+    df["UC"] = rng.choice([1, 50, 51, 200, 500, 501, 4000, 4001], 400)
+    df["Date du dernier RI"] = pd.to_datetime(df["Date du dernier RI"])
+    _assert_parity(df, criteria, compiled)
+
+
+def test_parity_with_missing_criteria_columns(criteria, compiled):
+    rng = np.random.default_rng(7)
+    df = random_frame(rng, 200).drop(columns=["Rebut", "Flux Pièce", "Date du dernier RI"])
+    _assert_parity(df, criteria, compiled)
+
+
+def test_empty_frame(criteria, compiled):
+    df = random_frame(np.random.default_rng(0), 0)
+    _assert_parity(df, criteria, compiled)
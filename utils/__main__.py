@@ -0,0 +1,149 @@
+"""
+Traitement par lot, sans interface : python -m utils DOSSIER_ENTREE DOSSIER_SORTIE
+
+Chaque classeur .xlsx du dossier d'entrée est mappé, enrichi et scoré (et
+optionnellement prévu) dans un pool de processus ; chaque processus écrit
+lui-même son fichier de sortie.
+"""
+import argparse
+import glob
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from utils.criteria import load_criteria
+from utils.data_loader import get_loader, set_data_dir
+from utils.file_utils import EXCEL_CHUNKSIZE, EXPORT_FORMATS
+from utils.pipeline import process_excel
+
+# Critères compilés reçus du processus parent (un exemplaire par processus)
+_worker_criteria = None
+
+
+def _init_worker(compiled, data_dir):
+    global _worker_criteria
+    _worker_criteria = compiled
+    set_data_dir(data_dir)
+
+
+def _write_atomic(data, path):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _forecast_frame(df_final):
+    import pandas as pd
+    from utils.forecasting import forecast_quantity
+
+    # Pas de pool imbriqué : le parallélisme se fait déjà par fichier
+    results, skipped = forecast_quantity(df_final, max_workers=1)
+    if not results:
+        return None
+    return pd.concat(
+        [forecast.assign(Produit=produit) for produit, forecast in results.items()],
+        ignore_index=True,
+    )[["Produit", "ds", "yhat", "yhat_lower", "yhat_upper"]]
+
+
+def process_file(path, output_dir, fmt="xlsx", chunksize=EXCEL_CHUNKSIZE, forecast=False):
+    """Score one workbook and write its result(s). Returns a summary dict."""
+    start = time.perf_counter()
+    result = process_excel(path, chunksize=chunksize, compiled=_worker_criteria)
+    export, _, extension = EXPORT_FORMATS[fmt]
+    name = os.path.splitext(os.path.basename(path))[0]
+    outputs = [os.path.join(output_dir, f"{name}_résultat.{extension}")]
+    _write_atomic(export(result.df_final), outputs[0])
+
+    if forecast:
+        forecasts = _forecast_frame(result.df_final)
+        if forecasts is not None:
+            outputs.append(os.path.join(output_dir, f"{name}_prévision.{extension}"))
+            _write_atomic(export(forecasts), outputs[-1])
+
+    return {
+        "fichier": path,
+        "sorties": outputs,
+        "lignes": len(result.df_final),
+        "références manquantes": int(result.missing.sum()),
+        "durée": time.perf_counter() - start,
+    }
+
+
+def run_batch(input_dir, output_dir, workers=None, fmt="xlsx", pattern="*.xlsx", chunksize=EXCEL_CHUNKSIZE, forecast=False, criteria_path=None):
+    """
+    Process every workbook of `input_dir` matching `pattern` in a process pool.
+    Yields (path, summary dict or None, error message or None) as files complete.
+    """
+    paths = sorted(glob.glob(os.path.join(input_dir, pattern)))
+    if not paths:
+        return
+    os.makedirs(output_dir, exist_ok=True)
+    # Critères compilés une fois ici et transmis aux processus ; la base de
+    # référence SQLite est construite avant le lancement du pool puis lue
+    # (mmap) par tous les processus
+    loader = get_loader()
+    compiled = load_criteria(criteria_path)
+    loader.references.open()
+
+    workers = min(workers or os.cpu_count() or 1, len(paths))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(compiled, loader.data_dir)) as pool:
+        futures = {
+            pool.submit(process_file, path, output_dir, fmt, chunksize, forecast): path
+            for path in paths
+        }
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                yield path, future.result(), None
+            except Exception as e:
+                yield path, None, str(e)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m utils",
+        description="Scoring, enrichissement et prévision par lot des fichiers Excel d'un dossier.",
+    )
+    parser.add_argument("input_dir", help="dossier contenant les fichiers .xlsx")
+    parser.add_argument("output_dir", help="dossier des résultats")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="nombre de processus (défaut : un par CPU)")
+    parser.add_argument("-f", "--format", choices=list(EXPORT_FORMATS), default="xlsx", help="format des résultats")
+    parser.add_argument("--pattern", default="*.xlsx", help="motif des fichiers à traiter")
+    parser.add_argument("--chunksize", type=int, default=EXCEL_CHUNKSIZE, help="lignes lues par bloc")
+    parser.add_argument("--forecast", action="store_true", help="ajouter la prévision de la demande")
+    parser.add_argument("--criteria", default=None, help="fichier des critères de pondération (défaut : celui du dossier de données)")
+    parser.add_argument("--data-dir", default=None, help="dossier de données (critères, base de référence)")
+    args = parser.parse_args(argv)
+    if args.data_dir:
+        set_data_dir(args.data_dir)
+
+    failures = 0
+    processed = 0
+    for path, summary, error in run_batch(
+        args.input_dir, args.output_dir, args.workers, args.format,
+        args.pattern, args.chunksize, args.forecast, args.criteria,
+    ):
+        processed += 1
+        if error:
+            failures += 1
+            print(f"[erreur] {path} : {error}", file=sys.stderr)
+        else:
+            print(f"[ok] {path} → {', '.join(summary['sorties'])} "
+                  f"({summary['lignes']} lignes, {summary['références manquantes']} référence(s) manquante(s), "
+                  f"{summary['durée']:.1f} s)")
+    if not processed:
+        print(f"Aucun fichier {args.pattern} dans {args.input_dir}", file=sys.stderr)
+        return 1
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
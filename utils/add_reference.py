@@ -1,30 +1,107 @@
+import contextlib
 import json
 import os
+import tempfile
 
-def add_reference(new_entry, json_path="data/Planning_Inventaire_Integral_clean.json"):
-    # Load existing data
-    if not os.path.exists(json_path):
-        data = []
-    else:
-        with open(json_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-    # Add new entry
-    data.append(new_entry)
-
-    # Custom serializer for non-serializable objects
-    def default_serializer(obj):
+from utils.data_loader import get_loader
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+# Custom serializer for non-serializable objects
+def default_serializer(obj):
+    try:
+        import pandas as pd
+        import numpy as np
+        if isinstance(obj, (pd.Timestamp, np.datetime64)):
+            return str(obj)
+    except ImportError:
+        pass
+    if hasattr(obj, 'isoformat'):
+        return obj.isoformat()
+    return str(obj)
+
+
+@contextlib.contextmanager
+def file_lock(path):
+    """Exclusive lock on `path` (created if needed), shared by every process writing the base."""
+    with open(path, "a+") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
         try:
-            import pandas as pd
-            import numpy as np
-            if isinstance(obj, (pd.Timestamp, np.datetime64)):
-                return str(obj)
-        except ImportError:
-            pass
-        if hasattr(obj, 'isoformat'):
-            return obj.isoformat()
-        return str(obj)
-
-    # Write back to file
-    with open(json_path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2, default=default_serializer)
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _atomic_write_json(data, json_path):
+    # Écriture dans un fichier temporaire du même dossier puis renommage atomique
+    directory = os.path.dirname(os.path.abspath(json_path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".json")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, json_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def add_references(new_entries, json_path=None, store=None):
+    """
+    Append several products to the reference base in one write.
+    Args:
+        new_entries: iterable of dicts (one per product)
+        json_path: reference JSON file (default: the one of the data directory)
+        store: ReferenceStore to update in place (defaults to the loader's store
+            when it is backed by the same JSON file)
+    Returns:
+        Number of entries added
+    """
+    # Normalise values once (Timestamp, numpy types...) so that the JSON file
+    # and the store receive exactly the same data
+    entries = json.loads(json.dumps(list(new_entries), ensure_ascii=False, default=default_serializer))
+    if not entries:
+        return 0
+    loader = get_loader()
+    json_path = json_path or loader.reference_json_path
+    if store is None:
+        store = loader.references
+    if store.json_path is None or os.path.abspath(store.json_path) != os.path.abspath(json_path):
+        store = None
+
+    with file_lock(f"{json_path}.lock"):
+        if store is not None:
+            # Ouvrir (et au besoin reconstruire) la base avant de réécrire le JSON :
+            # sinon le JSON plus récent ferait reconstruire la base depuis ce fichier
+            store.open(lock_held=True)
+        # Load existing data
+        if not os.path.exists(json_path):
+            data = []
+        else:
+            with open(json_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        data.extend(entries)
+        _atomic_write_json(data, json_path)
+        if store is not None:
+            store.add_many(entries, source_mtime=os.stat(json_path).st_mtime_ns)
+    return len(entries)
+
+
+def add_reference(new_entry, json_path=None):
+    add_references([new_entry], json_path=json_path)
     return True
@@ -1,22 +1,119 @@
+import hashlib
+import json
+import os
+import tempfile
+from collections import namedtuple
+
+import numpy as np
 import pandas as pd
-from sklearn.ensemble import IsolationForest
 
-def detect_anomalies(df, features=None, contamination=0.05, random_state=42):
+from utils.data_loader import CACHE_DIR
+from utils.file_utils import dataframe_fingerprint, evict_lru
+from utils.profiling import timed
+
+ANOMALY_MODEL_DIR = os.path.join(CACHE_DIR, "anomaly_models")
+# Modèles gardés sur disque (les moins récemment utilisés sont supprimés au-delà)
+ANOMALY_MODEL_MAX_ENTRIES = 200
+ANOMALY_MODEL_MAX_BYTES = 512 * 1024 * 1024
+# Nombre maximal de lignes utilisées pour l'apprentissage (échantillon aléatoire)
+MAX_FIT_ROWS = 100_000
+
+# labels: -1 anomalie, 1 normal ; scores: score_samples (plus bas = plus anormal, NaN si non évalué)
+AnomalyResult = namedtuple("AnomalyResult", ["labels", "scores", "features"])
+
+
+def _model_path(X, params, model_dir):
+    h = hashlib.sha256()
+    h.update(dataframe_fingerprint(X).encode("utf-8"))
+    h.update(json.dumps(params, sort_keys=True, default=str).encode("utf-8"))
+    return os.path.join(model_dir, f"{h.hexdigest()}.joblib")
+
+
+def fit_model(X, contamination=0.05, random_state=42, max_samples="auto", n_jobs=-1, max_fit_rows=MAX_FIT_ROWS):
+    """Fit an IsolationForest on at most `max_fit_rows` rows of X."""
+    from sklearn.ensemble import IsolationForest
+
+    if len(X) > max_fit_rows:
+        X = X.sample(n=max_fit_rows, random_state=random_state)
+    model = IsolationForest(
+        contamination=contamination,
+        random_state=random_state,
+        max_samples=max_samples,
+        n_jobs=n_jobs,
+    )
+    return model.fit(X)
+
+
+def load_or_fit_model(X, contamination=0.05, random_state=42, max_samples="auto", n_jobs=-1, max_fit_rows=MAX_FIT_ROWS, model_dir=ANOMALY_MODEL_DIR):
+    """
+    Return the IsolationForest for this dataset, fitting and saving it only the
+    first time (models are stored per fingerprint of X and parameters, and
+    evicted least recently used first beyond ANOMALY_MODEL_MAX_ENTRIES or
+    ANOMALY_MODEL_MAX_BYTES).
+    """
+    import joblib
+
+    params = {
+        "contamination": contamination,
+        "random_state": random_state,
+        "max_samples": max_samples,
+        "max_fit_rows": max_fit_rows,
+    }
+    path = _model_path(X, params, model_dir) if model_dir else None
+    if path and os.path.exists(path):
+        try:
+            model = joblib.load(path)
+            # mtime = dernière utilisation, pour l'éviction
+            os.utime(path)
+            return model
+        except Exception:
+            pass
+    model = fit_model(X, contamination, random_state, max_samples, n_jobs, max_fit_rows)
+    if path:
+        os.makedirs(model_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=model_dir, suffix=".tmp")
+        os.close(fd)
+        try:
+            joblib.dump(model, tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        evict_lru(model_dir, ".joblib", ANOMALY_MODEL_MAX_ENTRIES, ANOMALY_MODEL_MAX_BYTES)
+    return model
+
+
+@timed()
+def detect_anomalies(df, features=None, contamination=0.05, random_state=42, max_samples="auto", n_jobs=-1, max_fit_rows=MAX_FIT_ROWS, model_dir=ANOMALY_MODEL_DIR):
     """
     Detect anomalies in the given DataFrame using IsolationForest.
+    The input frame is not modified.
     Args:
         df: pandas DataFrame with inventory data
         features: list of column names to use for detection
         contamination: expected proportion of outliers
         random_state: random seed
+        max_samples: samples drawn per tree (IsolationForest)
+        n_jobs: parallel jobs for fitting and scoring (-1: all cores)
+        max_fit_rows: the model is fitted on a random sample of at most this many rows
+        model_dir: where fitted models are kept per dataset fingerprint (None: no persistence)
     Returns:
-        DataFrame with an 'anomaly' column (-1: anomaly, 1: normal)
+        AnomalyResult(labels, scores, features): arrays aligned with the rows of df,
+        labels -1 for anomalies and 1 otherwise (rows with missing features are 1)
     """
     if features is None:
         # Default to common numeric fields if not specified
-        features = [col for col in df.columns if df[col].dtype in ['float64', 'int64']]
-    X = df[features].dropna()
-    model = IsolationForest(contamination=contamination, random_state=random_state)
-    df['anomaly'] = 1
-    df.loc[X.index, 'anomaly'] = model.fit_predict(X)
-    return df
+        features = [col for col in df.columns if pd.api.types.is_numeric_dtype(df[col]) and not pd.api.types.is_bool_dtype(df[col])]
+    X = df[features]
+    complete = X.notna().all(axis=1).to_numpy()
+    X = X[complete]
+
+    labels = np.ones(len(df), dtype=np.int8)
+    scores = np.full(len(df), np.nan)
+    if len(X):
+        model = load_or_fit_model(X, contamination, random_state, max_samples, n_jobs, max_fit_rows, model_dir)
+        model_scores = model.score_samples(X)
+        scores[complete] = model_scores
+        # Même règle que IsolationForest.predict, sans recalculer les scores
+        labels[complete] = np.where(model_scores - model.offset_ < 0, -1, 1)
+    return AnomalyResult(labels, scores, list(features))
@@ -0,0 +1,202 @@
+import hashlib
+import json
+import os
+import re
+import threading
+
+import numpy as np
+import pandas as pd
+
+# --- Parse interval rules like "37 à 72 Jours", "< 20", ">=516 & <688"
+def _numeric_rule(condition):
+    """Return a predicate for a numeric specification, or None if it is an exact-match label."""
+    condition = condition.strip()
+
+    if ">=" in condition and "<" in condition and "&" in condition:
+        match = re.findall(r"\d+", condition)
+        if len(match) == 2:
+            a, b = map(float, match)
+            return lambda v: float(a) <= float(v) < float(b)
+
+    if "à" in condition:
+        match = re.findall(r"\d+", condition)
+        if len(match) == 2:
+            a, b = map(float, match)
+            return lambda v: a <= float(v) <= b
+
+    if condition.startswith(">="):
+        match = re.findall(r"\d+", condition)
+        if match:
+            return lambda v: float(v) >= float(match[0])
+
+    if condition.startswith("<"):
+        match = re.findall(r"\d+", condition)
+        if match:
+            return lambda v: float(v) < float(match[0])
+
+    if condition.startswith(">"):
+        match = re.findall(r"\d+", condition)
+        if match:
+            return lambda v: float(v) > float(match[0])
+
+    return None
+
+
+def parse_interval(condition):
+    rule = _numeric_rule(condition)
+    if rule is not None:
+        return rule
+    return lambda v: str(v).strip().lower() == condition.strip().lower()
+
+
+class CompiledCriterion:
+    """
+    One entry of critere.json turned into lookup tables usable on whole columns.
+
+    Numeric specifications become sorted bin edges: every value falls either on an
+    edge or strictly between two edges, and each of these segments is resolved once
+    to the first matching specification (same precedence as a linear scan).
+    Label specifications become a dict keyed by the normalised label.
+    """
+
+    def __init__(self, critere):
+        self.raw = critere
+        self.name = critere["Critère"]
+        self.coefficient = float(critere["Coefficient"])
+        specs = critere["Spécifications"]
+        self.n_specs = len(specs)
+        self.labels = [spec["Spécification"] for spec in specs]
+        # Pondération par spécification, la dernière case (0) sert quand rien ne correspond
+        self.ponds = np.array([spec["Pondération"] for spec in specs] + [0], dtype=np.float64)
+
+        rules = []
+        self.exact = {}
+        for i, spec in enumerate(specs):
+            condition = spec["Spécification"]
+            rule = _numeric_rule(condition)
+            if rule is None:
+                self.exact.setdefault(condition.strip().lower(), i)
+            else:
+                rules.append((i, rule, [float(x) for x in re.findall(r"\d+", condition)]))
+        self.has_numeric = bool(rules)
+
+        self.edges = np.array(sorted({b for _, _, bounds in rules for b in bounds}), dtype=np.float64)
+        # Segment 2k is the open interval below edges[k] (2m is above the last edge),
+        # segment 2k+1 is the point edges[k] itself.
+        representatives = []
+        for k, edge in enumerate(self.edges):
+            representatives.append(edge - 1 if k == 0 else (self.edges[k - 1] + edge) / 2)
+            representatives.append(edge)
+        representatives.append(self.edges[-1] + 1 if len(self.edges) else 0.0)
+
+        self.segments = np.full(len(representatives), self.n_specs, dtype=np.int64)
+        for s, rep in enumerate(representatives):
+            for i, rule, _ in rules:
+                if rule(rep):
+                    self.segments[s] = i
+                    break
+
+    def spec_indices(self, values):
+        """Index of the first matching specification for each (non-null) value, n_specs if none."""
+        idx = np.full(len(values), self.n_specs, dtype=np.int64)
+
+        if self.has_numeric:
+            if pd.api.types.is_datetime64_any_dtype(values):
+                x = np.full(len(values), np.nan)
+            else:
+                x = pd.to_numeric(values, errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+            valid = ~np.isnan(x)
+            pos = np.searchsorted(self.edges, x[valid], side="left")
+            on_edge = self.edges[np.minimum(pos, len(self.edges) - 1)] == x[valid]
+            idx[valid] = self.segments[2 * pos + on_edge]
+
+        if self.exact:
+            labels = values.astype(str).str.strip().str.lower()
+            matched = labels.map(self.exact).fillna(self.n_specs).to_numpy(dtype=np.int64)
+            idx = np.minimum(idx, matched)
+
+        return idx
+
+    def ponderations(self, values):
+        return self.ponds[self.spec_indices(values)]
+
+
+class CompiledCriteria:
+    """
+    The whole critere.json compiled once, with the version of the file it came from.
+
+    `mtime` and `digest` identify the source file; `load_criteria` rebuilds the
+    object when either changes, so the Streamlit app, batch jobs and tests can all
+    share the same instance.
+    """
+
+    def __init__(self, criteria, path=None, mtime=None, digest=None):
+        self.raw = criteria
+        self.path = path
+        self.mtime = mtime
+        self.digest = digest
+        self.criteria = [CompiledCriterion(c) for c in criteria]
+        self.by_name = {c.name: c for c in self.criteria}
+
+    @classmethod
+    def from_file(cls, path):
+        mtime, content = _read(path)
+        return cls.from_bytes(content, path=path, mtime=mtime)
+
+    @classmethod
+    def from_bytes(cls, content, path=None, mtime=None, digest=None):
+        digest = digest or hashlib.sha256(content).hexdigest()
+        return cls(json.loads(content.decode("utf-8")), path=path, mtime=mtime, digest=digest)
+
+    def __iter__(self):
+        return iter(self.criteria)
+
+    def __len__(self):
+        return len(self.criteria)
+
+    def __getitem__(self, name):
+        return self.by_name[name]
+
+    def __contains__(self, name):
+        return name in self.by_name
+
+    @property
+    def version(self):
+        return self.digest
+
+
+def _read(path):
+    mtime = os.stat(path).st_mtime_ns
+    with open(path, "rb") as f:
+        return mtime, f.read()
+
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def load_criteria(path=None):
+    """
+    Return the CompiledCriteria for `path` (default: critere.json of the data
+    directory), rebuilding it only when the file changed.
+
+    A changed mtime triggers a hash of the file; the rules are recompiled only if
+    the content hash differs too (a simple `touch` keeps the cached object).
+    """
+    if path is None:
+        from utils.data_loader import get_loader
+        path = get_loader().criteria_path
+    key = os.path.abspath(path)
+    mtime = os.stat(path).st_mtime_ns
+    with _cache_lock:
+        compiled = _cache.get(key)
+        if compiled is not None and compiled.mtime == mtime:
+            return compiled
+        mtime, content = _read(path)
+        digest = hashlib.sha256(content).hexdigest()
+        if compiled is not None and compiled.digest == digest:
+            compiled.mtime = mtime
+            return compiled
+        fresh = CompiledCriteria.from_bytes(content, path=path, mtime=mtime, digest=digest)
+        _cache[key] = fresh
+        return fresh
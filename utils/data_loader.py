@@ -0,0 +1,87 @@
+import os
+import threading
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Dossier des données : variable d'environnement, sinon le dossier data/ du projet
+DATA_DIR_ENV = "SMARTRI_DATA_DIR"
+DEFAULT_DATA_DIR = os.path.join(PROJECT_DIR, "data")
+# Caches sur disque (prévisions, modèles d'anomalies), indépendants du dossier courant
+CACHE_DIR = os.path.join(PROJECT_DIR, ".cache")
+
+CRITERIA_FILE = "critere.json"
+REFERENCE_JSON_FILE = "Planning_Inventaire_Integral_clean.json"
+REFERENCE_DB_FILE = "reference.sqlite"
+MAPPING_FILE = "column_mapping.json"
+
+
+class DataLoader:
+    """
+    Entry point to the data files of one data directory. Nothing is read when the
+    loader is created: criteria, mapping and reference store are opened on first
+    access (and the file-based ones are re-checked against their mtime).
+    """
+
+    def __init__(self, data_dir=None):
+        self.data_dir = os.path.abspath(data_dir or os.environ.get(DATA_DIR_ENV) or DEFAULT_DATA_DIR)
+        self._references = None
+        self._lock = threading.Lock()
+
+    def path(self, name):
+        return os.path.join(self.data_dir, name)
+
+    @property
+    def criteria_path(self):
+        return self.path(CRITERIA_FILE)
+
+    @property
+    def reference_json_path(self):
+        return self.path(REFERENCE_JSON_FILE)
+
+    @property
+    def reference_db_path(self):
+        return self.path(REFERENCE_DB_FILE)
+
+    @property
+    def mapping_path(self):
+        return self.path(MAPPING_FILE)
+
+    @property
+    def criteria(self):
+        from utils.criteria import load_criteria
+        return load_criteria(self.criteria_path)
+
+    @property
+    def mapping(self):
+        from utils.mapper import load_mapping
+        return load_mapping(self.mapping_path)
+
+    @property
+    def references(self):
+        with self._lock:
+            if self._references is None:
+                from utils.reference_store import ReferenceStore
+                self._references = ReferenceStore(self.reference_db_path, self.reference_json_path)
+            return self._references
+
+
+_loader = None
+_loader_lock = threading.Lock()
+
+
+def get_loader():
+    """The process-wide DataLoader (created on first call)."""
+    global _loader
+    with _loader_lock:
+        if _loader is None:
+            _loader = DataLoader()
+        return _loader
+
+
+def set_data_dir(data_dir):
+    """Point the process-wide loader at another data directory."""
+    global _loader
+    with _loader_lock:
+        if _loader is not None and _loader._references is not None:
+            _loader._references.close()
+        _loader = DataLoader(data_dir)
+        return _loader
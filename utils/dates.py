@@ -0,0 +1,65 @@
+import pandas as pd
+
+from utils.profiling import timed
+
+DATE_COLUMN = "Date du dernier RI"
+# Les dates Excel sont des nombres de jours depuis le 30/12/1899
+EXCEL_ORIGIN = "1899-12-30"
+# Format des dates dans la base de référence JSON, ex. "19/02/2025 12:05:27"
+REFERENCE_DATE_FORMAT = "%d/%m/%Y %H:%M:%S"
+
+
+def normalize_dates(series):
+    """
+    Convert a date column to datetime64 in one vectorized pass.
+    Handles datetimes, Excel serial numbers, dd/mm/YYYY HH:MM:SS and ISO 8601
+    strings; other slash- or dot-separated strings are parsed day-first. Values
+    that cannot be parsed become NaT.
+    """
+    if pd.api.types.is_datetime64_any_dtype(series):
+        if getattr(series.dt, "tz", None) is not None:
+            series = series.dt.tz_localize(None)
+        return series
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        return pd.to_datetime(series, unit="D", origin=EXCEL_ORIGIN, errors="coerce")
+
+    result = pd.Series(pd.NaT, index=series.index, dtype="datetime64[ns]")
+    pending = series.notna()
+
+    # Nombres (séries Excel), y compris stockés dans une colonne objet
+    serials = pd.to_numeric(series, errors="coerce")
+    numeric = serials.notna()
+    if numeric.any():
+        result[numeric] = pd.to_datetime(serials[numeric], unit="D", origin=EXCEL_ORIGIN, errors="coerce")
+    pending &= ~numeric
+
+    # Chaînes au format de la base de référence
+    if pending.any():
+        parsed = pd.to_datetime(series[pending].astype(str), format=REFERENCE_DATE_FORMAT, errors="coerce")
+        result[pending] = parsed
+        pending &= result.isna()
+
+    # ISO 8601 ("2025-02-03", "2025-02-03 00:00:00", datetime Python) : jamais jour en premier
+    if pending.any():
+        parsed = pd.to_datetime(series[pending].astype(str), format="ISO8601", errors="coerce", utc=True)
+        result[pending] = parsed.dt.tz_localize(None)
+        pending &= result.isna()
+
+    # Tout le reste : jour en premier seulement pour les dates à "/" ou "." (03/02/2025, 03.02.2025)
+    if pending.any():
+        text = series[pending].astype(str)
+        dayfirst = text.str.contains(r"^\s*\d{1,2}[/.]\d{1,2}[/.]\d{2,4}", regex=True).to_numpy()
+        for mask, first in ((dayfirst, True), (~dayfirst, False)):
+            if mask.any():
+                index = text.index[mask]
+                parsed = pd.to_datetime(series[index], format="mixed", dayfirst=first, errors="coerce", utc=True)
+                result[index] = parsed.dt.tz_localize(None)
+    return result
+
+
+@timed()
+def normalize_date_column(df, column=DATE_COLUMN):
+    """Normalize `column` of `df` in place (if present) and return df."""
+    if column in df.columns:
+        df[column] = normalize_dates(df[column])
+    return df
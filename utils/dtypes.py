@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+
+from utils.profiling import timed
+
+# Colonnes texte à faible cardinalité → category
+CATEGORY_COLUMNS = [
+    "Pays",
+    "Flux Pièce",
+    "Type d'emballage",
+    "Catégorie",
+    "Statut Inventaire",
+    "Pièces en suspicion de vol",
+]
+# Colonnes numériques à réduire (int8/int16/..., float32 si sans perte)
+NUMERIC_COLUMNS = ["UC", "Prix Pièce", "Rebut", "ECV/COR"]
+# Au-delà de cette proportion de valeurs distinctes, une colonne reste en texte
+MAX_CATEGORY_RATIO = 0.5
+
+
+def _downcast(series):
+    if pd.api.types.is_bool_dtype(series) or not pd.api.types.is_numeric_dtype(series):
+        return series
+    if pd.api.types.is_integer_dtype(series):
+        unsigned = series.min() >= 0 if len(series) else False
+        return pd.to_numeric(series, downcast="unsigned" if unsigned else "integer")
+    if pd.api.types.is_float_dtype(series) and series.dtype != np.float32:
+        as_float32 = series.astype(np.float32)
+        # Les prix ne doivent pas changer à l'export : float32 seulement si la conversion est exacte
+        if as_float32.astype(series.dtype).equals(series):
+            return as_float32
+    return series
+
+
+@timed()
+def optimize_dtypes(df, category_columns=CATEGORY_COLUMNS, numeric_columns=NUMERIC_COLUMNS, max_category_ratio=MAX_CATEGORY_RATIO):
+    """
+    Convert low-cardinality text columns to `category` and downcast numeric
+    columns, in place.
+    Returns:
+        (df, report) with report = {"avant": bytes, "après": bytes}
+    """
+    before = int(df.memory_usage(deep=True).sum())
+    for col in category_columns:
+        if col not in df.columns or isinstance(df[col].dtype, pd.CategoricalDtype):
+            continue
+        if pd.api.types.is_numeric_dtype(df[col]) or pd.api.types.is_datetime64_any_dtype(df[col]):
+            continue
+        if len(df) and df[col].nunique(dropna=True) / len(df) <= max_category_ratio:
+            df[col] = df[col].astype("category")
+    for col in numeric_columns:
+        if col in df.columns:
+            df[col] = _downcast(df[col])
+    after = int(df.memory_usage(deep=True).sum())
+    return df, {"avant": before, "après": after}
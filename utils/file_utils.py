@@ -1,8 +1,190 @@
-import pandas as pd
+import hashlib
+import os
+import threading
+from collections import OrderedDict
 from io import BytesIO
 
+import pandas as pd
+
+from utils.profiling import timed
+
+# Nombre de lignes Excel lues par bloc en mode streaming
+EXCEL_CHUNKSIZE = 50_000
+# Nombre d'exports gardés en mémoire (par empreinte de résultat et format)
+EXPORT_CACHE_SIZE = 8
+
+
+def dataframe_fingerprint(df):
+    """Content hash of a DataFrame (values, index, column names and dtypes)."""
+    h = hashlib.sha256()
+    h.update(repr(list(df.columns)).encode("utf-8"))
+    h.update(repr([str(t) for t in df.dtypes]).encode("utf-8"))
+    try:
+        h.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    except TypeError:
+        # Colonnes objet non hashables (listes, dicts...) : repli sur leur représentation texte
+        h.update(pd.util.hash_pandas_object(df.astype(str), index=True).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def evict_lru(directory, suffix, max_entries, max_bytes):
+    """
+    Delete the least recently used files ending with `suffix` in `directory`
+    (oldest mtime first) until at most `max_entries` files and `max_bytes` remain.
+    """
+    if not os.path.isdir(directory):
+        return
+    entries = []
+    with os.scandir(directory) as it:
+        for entry in it:
+            if entry.name.endswith(suffix):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+    entries.sort()
+    total = sum(size for _, size, _ in entries)
+    while entries and (len(entries) > max_entries or total > max_bytes):
+        _, size, path = entries.pop(0)
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total -= size
+
+
+def _cell(value):
+    # openpyxl n'accepte ni NaN/NaT ni les types pandas manquants
+    if value is None or value is pd.NaT:
+        return None
+    try:
+        if pd.isna(value):
+            return None
+    except (TypeError, ValueError):
+        pass
+    return value
+
+
+@timed()
 def convert_df_to_excel(df):
+    """xlsx export with openpyxl's write-only mode: rows are streamed, no cell objects are kept."""
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append([str(c) for c in df.columns])
+    for row in df.itertuples(index=False, name=None):
+        ws.append([_cell(v) for v in row])
     output = BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False)
+    wb.save(output)
     return output.getvalue()
+
+
+@timed()
+def convert_df_to_csv(df):
+    # Séparateur ";" et BOM UTF-8 pour une ouverture directe dans Excel (version française)
+    return df.to_csv(index=False, sep=";").encode("utf-8-sig")
+
+
+@timed()
+def convert_df_to_parquet(df):
+    output = BytesIO()
+    try:
+        df.to_parquet(output, index=False)
+    except ImportError as e:
+        raise ImportError("L'export Parquet nécessite pyarrow (pip install pyarrow).") from e
+    except (TypeError, ValueError):
+        # Colonnes objet de types mélangés : exportées en texte
+        output = BytesIO()
+        mixed = df.select_dtypes(include="object").columns
+        df.astype({c: "string" for c in mixed}).to_parquet(output, index=False)
+    return output.getvalue()
+
+
+# format: (fonction d'export, type MIME, extension)
+EXPORT_FORMATS = {
+    "xlsx": (convert_df_to_excel, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "xlsx"),
+    "csv": (convert_df_to_csv, "text/csv", "csv"),
+    "parquet": (convert_df_to_parquet, "application/vnd.apache.parquet", "parquet"),
+}
+
+_export_cache = OrderedDict()
+_export_lock = threading.Lock()
+
+
+@timed()
+def export_bytes(df, fmt="xlsx", fingerprint=None):
+    """
+    Bytes of `df` exported as `fmt`, memoized per (result fingerprint, format):
+    a result is only exported again when its content changes.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Format d'export inconnu : {fmt}")
+    key = (fingerprint or dataframe_fingerprint(df), fmt)
+    with _export_lock:
+        if key in _export_cache:
+            _export_cache.move_to_end(key)
+            return _export_cache[key]
+    data = EXPORT_FORMATS[fmt][0](df)
+    with _export_lock:
+        _export_cache[key] = data
+        while len(_export_cache) > EXPORT_CACHE_SIZE:
+            _export_cache.popitem(last=False)
+    return data
+
+
+def _header_names(header):
+    # Mêmes noms que pd.read_excel : "Unnamed: i" pour les en-têtes vides, suffixes ".1", ".2" pour les doublons
+    names = []
+    seen = {}
+    for i, name in enumerate(header):
+        if name is None or (isinstance(name, str) and not name.strip()):
+            name = f"Unnamed: {i}"
+        base = name
+        while name in seen:
+            seen[base] += 1
+            name = f"{base}.{seen[base]}"
+        seen.setdefault(name, 0)
+        names.append(name)
+    return names
+
+
+def iter_excel_chunks(source, chunksize=EXCEL_CHUNKSIZE, sheet_name=None, progress=None):
+    """
+    Read an xlsx file row by row (openpyxl read-only mode) and yield DataFrames
+    of at most `chunksize` rows, so the workbook is never fully loaded in memory.
+    Args:
+        source: path or file-like object
+        sheet_name: sheet to read (default: the first one, like pd.read_excel)
+        progress: optional callback(rows_read, total_rows or None)
+    """
+    from openpyxl import load_workbook
+
+    wb = load_workbook(source, read_only=True, data_only=True)
+    try:
+        ws = wb[sheet_name] if sheet_name else wb.worksheets[0]
+        total = ws.max_row - 1 if ws.max_row else None
+        rows = ws.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = _header_names(header)
+        width = len(columns)
+        buffer = []
+        done = 0
+        for row in rows:
+            if all(v is None for v in row):
+                continue
+            row = tuple(row[:width]) + (None,) * (width - len(row))
+            buffer.append(row)
+            if len(buffer) >= chunksize:
+                done += len(buffer)
+                yield pd.DataFrame(buffer, columns=columns)
+                buffer = []
+                if progress is not None:
+                    progress(done, total)
+        if buffer:
+            done += len(buffer)
+            yield pd.DataFrame(buffer, columns=columns)
+        if progress is not None:
+            progress(done, done)
+    finally:
+        wb.close()
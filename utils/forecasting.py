@@ -1,35 +1,255 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
 import pandas as pd
-from prophet import Prophet
 
-def forecast_quantity(df, produit_col="Produit", date_col="Date du dernier RI", qty_col="Quantité", periods=12):
+from utils.data_loader import CACHE_DIR
+from utils.dates import normalize_dates
+from utils.file_utils import evict_lru
+from utils.profiling import timed
+
+FORECAST_CACHE_DIR = os.path.join(CACHE_DIR, "forecasts")
+# Démarrage des processus Prophet : "fork" d'un serveur multi-thread (Streamlit) peut bloquer
+POOL_START_METHOD = "spawn"
+# En mode "auto", les séries plus courtes passent par le moteur rapide
+MIN_PROPHET_POINTS = 12
+# Demi-largeur de l'intervalle à 80 % (même largeur par défaut que Prophet)
+INTERVAL_Z = 1.2816
+
+# engine: "prophet", "fast" ou "cache" ; seconds: durée de l'ajustement pour ce produit
+ForecastResult = namedtuple("ForecastResult", ["produit", "forecast", "error", "engine", "seconds"])
+
+
+class ForecastCache:
+    """
+    Disk cache of forecasts keyed by (product, hash of its ds/y series, horizon,
+    Prophet params). One pickle per entry; reading an entry refreshes its mtime so
+    that eviction drops the least recently used entries first once `max_entries`
+    or `max_bytes` is exceeded.
+    """
+
+    def __init__(self, directory=FORECAST_CACHE_DIR, max_entries=5000, max_bytes=512 * 1024 * 1024):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def key(produit, data, periods, params=None):
+        h = hashlib.sha256()
+        h.update(repr(produit).encode("utf-8"))
+        h.update(pd.util.hash_pandas_object(data[["ds", "y"]], index=False).to_numpy().tobytes())
+        h.update(str(periods).encode("utf-8"))
+        h.update(json.dumps(params or {}, sort_keys=True, default=str).encode("utf-8"))
+        return h.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.pkl")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            forecast = pd.read_pickle(path)
+            os.utime(path)
+            return forecast
+        except (OSError, EOFError, ValueError, ImportError, AttributeError):
+            return None
+
+    def put(self, key, forecast, evict=True):
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        os.close(fd)
+        try:
+            forecast.to_pickle(tmp_path)
+            os.replace(tmp_path, self._path(key))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        if evict:
+            self.evict()
+
+    def evict(self):
+        evict_lru(self.directory, ".pkl", self.max_entries, self.max_bytes)
+
+    def clear(self):
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if name.endswith(".pkl"):
+                    os.remove(os.path.join(self.directory, name))
+
+
+forecast_cache = ForecastCache()
+
+
+def _prepare_group(group, date_col, qty_col):
+    # Prepare data for Prophet ('ds' already normalized by utils.dates)
+    data = group[[date_col, qty_col]].rename(columns={date_col: "ds", qty_col: "y"})
+    # Quantités texte ("x") → NaN avant dropna : les deux moteurs voient la même série nettoyée
+    data["y"] = pd.to_numeric(data["y"], errors="coerce")
+    return data.dropna(subset=["ds", "y"])
+
+
+def _fit_prophet(produit, data, periods, params=None):
+    """Fit one product. Runs in a worker process: returns a ForecastResult."""
+    start = time.perf_counter()
+    try:
+        # Import à la demande : prophet (Stan) est lourd et inutile au moteur rapide
+        from prophet import Prophet
+
+        model = Prophet(**(params or {}))
+        model.fit(data)
+        future = model.make_future_dataframe(periods=periods, freq='M')
+        forecast = model.predict(future)
+        return ForecastResult(produit, forecast[["ds", "yhat", "yhat_lower", "yhat_upper"]], None, "prophet", time.perf_counter() - start)
+    except Exception as e:
+        return ForecastResult(produit, None, str(e), "prophet", time.perf_counter() - start)
+
+
+def _future_dates(last_date, periods):
+    # Mêmes dates que Prophet.make_future_dataframe(freq='M') : fins de mois après la dernière date
+    dates = pd.date_range(start=last_date, periods=periods + 1, freq=pd.offsets.MonthEnd())
+    return dates[dates > last_date][:periods]
+
+
+def _fit_linear_trend(tasks, periods):
+    """
+    Fit a linear trend to every product at once with grouped NumPy sums
+    (least squares on days since each product's first date).
+    Returns a list of ForecastResult, in the order of `tasks`.
+    """
+    start = time.perf_counter()
+    lengths = np.array([len(data) for _, data, _ in tasks])
+    codes = np.repeat(np.arange(len(tasks)), lengths)
+    ds = np.concatenate([data["ds"].to_numpy(dtype="datetime64[ns]") for _, data, _ in tasks]).view("i8")
+    y = np.concatenate([pd.to_numeric(data["y"], errors="coerce").to_numpy(dtype=float) for _, data, _ in tasks])
+
+    origin = np.minimum.reduceat(ds, np.concatenate([[0], np.cumsum(lengths)[:-1]]))
+    x = (ds - origin[codes]) / 86_400e9
+    n = lengths.astype(float)
+    sx = np.bincount(codes, x)
+    sy = np.bincount(codes, y)
+    sxx = np.bincount(codes, x * x)
+    sxy = np.bincount(codes, x * y)
+    denom = n * sxx - sx * sx
+    slope = np.divide(n * sxy - sx * sy, denom, out=np.zeros_like(denom), where=denom > 0)
+    intercept = (sy - slope * sx) / n
+    residuals = y - (intercept[codes] + slope[codes] * x)
+    sigma = np.sqrt(np.bincount(codes, residuals * residuals) / np.maximum(n - 2, 1))
+
+    forecasts = []
+    for i, (_, data, _) in enumerate(tasks):
+        history = pd.DatetimeIndex(data["ds"].drop_duplicates().sort_values())
+        dates = history.append(_future_dates(history[-1], periods))
+        days = (dates.to_numpy(dtype="datetime64[ns]").view("i8") - origin[i]) / 86_400e9
+        yhat = intercept[i] + slope[i] * days
+        forecasts.append(pd.DataFrame({
+            "ds": dates,
+            "yhat": yhat,
+            "yhat_lower": yhat - INTERVAL_Z * sigma[i],
+            "yhat_upper": yhat + INTERVAL_Z * sigma[i],
+        }))
+    seconds = (time.perf_counter() - start) / len(tasks)
+    return [ForecastResult(produit, forecast, None, "fast", seconds) for (produit, _, _), forecast in zip(tasks, forecasts)]
+
+
+def iter_forecasts(df, produit_col="Produit", date_col="Date du dernier RI", qty_col="Quantité", periods=12, max_workers=None, prophet_params=None, cache=forecast_cache, engine="auto", min_prophet_points=MIN_PROPHET_POINTS, start_method=POOL_START_METHOD):
+    """
+    Forecast each product and yield results as fits complete.
+    Groups without enough data are yielded first, before any process is started.
+    Short series go to a vectorized linear-trend engine fitted on all products at
+    once; the others are fitted with Prophet in a process pool, except products
+    whose history is unchanged since a previous run (served from `cache`).
+    Args:
+        max_workers: number of worker processes (None: one per CPU, 1: no pool)
+        prophet_params: keyword arguments for Prophet()
+        cache: ForecastCache to read/write, None to always refit
+        engine: "auto" (by series length), "prophet" or "fast"
+        min_prophet_points: in "auto" mode, shorter series use the fast engine
+        start_method: multiprocessing start method of the pool ("spawn",
+            "forkserver" or "fork")
+    Yields:
+        ForecastResult(produit, forecast_df or None, error or None, engine, seconds)
+    """
+    if engine not in ("auto", "prophet", "fast"):
+        raise ValueError(f"Moteur de prévision inconnu : {engine}")
+    # Conversion des dates une seule fois pour toute la colonne (séries Excel, texte, datetime)
+    df = df[[produit_col, date_col, qty_col]].assign(**{date_col: normalize_dates(df[date_col])})
+    fast_tasks = []
+    tasks = []
+    for produit, group in df.groupby(produit_col):
+        data = _prepare_group(group, date_col, qty_col)
+        if len(data) < 2:
+            yield ForecastResult(produit, None, "Not enough valid date/quantity values", None, 0.0)
+        elif engine == "fast" or (engine == "auto" and len(data) < min_prophet_points):
+            fast_tasks.append((produit, data, None))
+        else:
+            tasks.append((produit, data, None))
+
+    if fast_tasks:
+        yield from _fit_linear_trend(fast_tasks, periods)
+
+    pending = []
+    for produit, data, _ in tasks:
+        key = cache.key(produit, data, periods, prophet_params) if cache is not None else None
+        forecast = cache.get(key) if cache is not None else None
+        if forecast is not None:
+            yield ForecastResult(produit, forecast, None, "cache", 0.0)
+        else:
+            pending.append((produit, data, key))
+    if not pending:
+        return
+
+    def store(result):
+        if cache is not None and result.forecast is not None:
+            cache.put(keys[result.produit], result.forecast, evict=False)
+        return result
+
+    keys = {produit: key for produit, _, key in pending}
+    workers = min(max_workers or os.cpu_count() or 1, len(pending))
+    if workers == 1:
+        for produit, data, _ in pending:
+            yield store(_fit_prophet(produit, data, periods, prophet_params))
+    else:
+        context = multiprocessing.get_context(start_method)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            futures = [pool.submit(_fit_prophet, produit, data, periods, prophet_params) for produit, data, _ in pending]
+            for future in as_completed(futures):
+                yield store(future.result())
+    if cache is not None:
+        cache.evict()
+
+
+@timed()
+def forecast_quantity(df, produit_col="Produit", date_col="Date du dernier RI", qty_col="Quantité", periods=12, max_workers=None, prophet_params=None, cache=forecast_cache, engine="auto", min_prophet_points=MIN_PROPHET_POINTS, with_report=False, start_method=POOL_START_METHOD):
     """
-    For each product, forecast future quantity using Prophet.
-    Returns a dict: {produit: forecast_df}
+    For each product, forecast future quantity (see iter_forecasts for engines,
+    parallelism and caching).
+    Returns a dict: {produit: forecast_df} and the skipped products; with
+    `with_report`, also a DataFrame giving per product the engine used and the
+    fit time in seconds.
     """
+    # Clés de groupby (tri tolérant aux identifiants mêlant int et str, comme iter_forecasts)
+    order = {produit: i for i, produit in enumerate(df.groupby(produit_col).size().index)}
     results = {}
     skipped = []
-    for produit, group in df.groupby(produit_col):
-        # Prepare data for Prophet
-        data = group[[date_col, qty_col]].copy()
-        data = data.rename(columns={date_col: "ds", qty_col: "y"})
-        # Try to convert numeric 'ds' to dates if needed
-        if data["ds"].dtype in [int, float] or data["ds"].apply(lambda x: isinstance(x, (int, float))).all():
-            # Assume numbers are days since a reference date (e.g., 1900-01-01)
-            ref_date = pd.Timestamp("1900-01-01")
-            data["ds"] = pd.to_numeric(data["ds"], errors='coerce')
-            data["ds"] = data["ds"].apply(lambda x: ref_date + pd.Timedelta(days=x) if pd.notnull(x) else pd.NaT)
+    report = []
+    for result in iter_forecasts(df, produit_col, date_col, qty_col, periods, max_workers, prophet_params, cache, engine, min_prophet_points, start_method):
+        if result.forecast is None:
+            skipped.append((result.produit, result.error))
         else:
-            data["ds"] = pd.to_datetime(data["ds"], errors='coerce')
-        data = data.dropna(subset=["ds", "y"])
-        if len(data) < 2:
-            skipped.append((produit, "Not enough valid date/quantity values"))
-            continue
-        try:
-            model = Prophet()
-            model.fit(data)
-            future = model.make_future_dataframe(periods=periods, freq='M')
-            forecast = model.predict(future)
-            results[produit] = forecast[["ds", "yhat", "yhat_lower", "yhat_upper"]]
-        except Exception as e:
-            skipped.append((produit, str(e)))
+            results[result.produit] = result.forecast
+        report.append({"Produit": result.produit, "Moteur": result.engine, "Durée (s)": result.seconds, "Erreur": result.error})
+    # Même ordre que groupby, quel que soit l'ordre de fin des processus
+    results = dict(sorted(results.items(), key=lambda item: order.get(item[0], len(order))))
+    skipped.sort(key=lambda item: order.get(item[0], len(order)))
+    if with_report:
+        report = pd.DataFrame(report, columns=["Produit", "Moteur", "Durée (s)", "Erreur"])
+        report = report.sort_values("Produit", key=lambda col: col.map(order), kind="stable").reset_index(drop=True)
+        return results, skipped, report
     return results, skipped
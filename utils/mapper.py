@@ -1,22 +1,50 @@
-def map_columns(df):
-    rename_map = {
-        "Date fin série": "Date du dernier RI",
-        "Date dernier RI": "Date du dernier RI",
-        "Rebut Quantité": "Rebut",
-        "UC": "UC",
-        "Prix Pièce": "Prix Pièce",
-        "Pays": "Pays",
-        "Raison sociale de l'expéditeur": "Fournisseur",
-        # Quantity column mappings
-        "Qte": "Quantité",
-        "Qté": "Quantité",
-        "quantite": "Quantité",
-        "Quantite": "Quantité",
-        "QUANTITE": "Quantité",
-        "QUANTITY": "Quantité",
-        "Quantity": "Quantité",
-    }
-    df = df.rename(columns=rename_map)
+import json
+import os
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from utils.profiling import timed
+
+
+class ColumnMapping:
+    """column_mapping.json compiled once: rename table and lowercase country → flux lookup."""
+
+    def __init__(self, config):
+        self.rename_map = dict(config["Alias colonnes"])
+        self.default_flux = config["Flux par défaut"]
+        self.flux_by_pays = {}
+        for flux, pays_list in config["Flux par pays"].items():
+            for pays in pays_list:
+                self.flux_by_pays.setdefault(pays.lower(), flux)
+
+    def flux(self, pays):
+        if not isinstance(pays, str):
+            return self.default_flux
+        return self.flux_by_pays.get(pays.lower(), self.default_flux)
+
+
+@lru_cache(maxsize=4)
+def _load_mapping(path, mtime):
+    with open(path, encoding="utf-8") as f:
+        return ColumnMapping(json.load(f))
+
+
+def load_mapping(path=None):
+    # Recompilé seulement si le fichier a changé (clé : chemin + mtime)
+    if path is None:
+        from utils.data_loader import get_loader
+        path = get_loader().mapping_path
+    return _load_mapping(os.path.abspath(path), os.stat(path).st_mtime_ns)
+
+
+@timed()
+def map_columns(df, mapping=None):
+    mapping = load_mapping() if mapping is None else mapping
+    df = df.rename(columns=mapping.rename_map)
+    # Plusieurs alias peuvent donner le même nom : garder la première colonne
+    df = df.loc[:, ~df.columns.duplicated()]
     # Ensure 'Quantité' column always exists
     if "Quantité" not in df.columns:
         df["Quantité"] = 0
@@ -39,19 +67,24 @@ def map_columns(df):
 
     # Automatically add 'Flux Pièce' using 'Pays' if not present
     if "Flux Pièce" not in df.columns:
-        df["Flux Pièce"] = df["Pays"].apply(infer_flux_pays)
+        if "Pays" in df.columns:
+            df["Flux Pièce"] = infer_flux(df["Pays"], mapping)
+        else:
+            df["Flux Pièce"] = mapping.default_flux
     return df
 
+
+def infer_flux(pays, mapping=None):
+    """
+    Vectorized country → flux: the column is made categorical and each distinct
+    country is resolved once, then broadcast through the category codes.
+    """
+    mapping = load_mapping() if mapping is None else mapping
+    pays = pays.astype("category")
+    flux = [mapping.flux(p) for p in pays.cat.categories] + [mapping.default_flux]
+    # code -1 (valeur manquante) → dernier élément : flux par défaut
+    return pd.Series(np.asarray(flux, dtype=object)[pays.cat.codes.to_numpy()], index=pays.index)
+
+
 def infer_flux_pays(pays):
-    if not isinstance(pays, str):
-        return "Local"
-    p = pays.lower()
-    if p in ["france", "allemagne", "italie", "belgique"]:
-        return "Europe Ouest &Central"
-    elif p in ["espagne", "portugal"]:
-        return "Ibérique"
-    elif p in ["pologne", "hongrie", "roumanie"]:
-        return "PECO"
-    elif p in ["chine", "usa", "mexique", "turquie"]:
-        return "Overseas"
-    return "Local"
+    return load_mapping().flux(pays)
@@ -0,0 +1,107 @@
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from utils.data_loader import get_loader
+from utils.dates import normalize_date_column
+from utils.dtypes import optimize_dtypes
+from utils.file_utils import EXCEL_CHUNKSIZE, iter_excel_chunks
+from utils.mapper import map_columns
+from utils.profiling import stage, timed
+from utils.scorer import ScoreComponents, enrich_with_existing_scores, rescore
+
+# memory: {"avant": octets, "après": octets} autour de l'optimisation des types
+# components: ScoreComponents de df_final, pour refresh_scores
+ProcessedFile = namedtuple("ProcessedFile", ["preview", "df_mapped", "df_final", "missing", "memory", "components"])
+
+
+@timed()
+def map_and_enrich(df, compiled=None):
+    """
+    Map columns, normalize dates and score (with `compiled` criteria if given).
+    Returns (df_mapped, df_final, missing, components) where `missing` flags the
+    rows whose Produit is not in the reference base.
+    """
+    # map_columns renames, deduplicates columns and infers 'Flux Pièce' in one pass
+    df_mapped = map_columns(df).reset_index(drop=True)
+    # Dates converties une seule fois, avant le scoring et la prévision
+    normalize_date_column(df_mapped)
+    df_final, components = enrich_with_existing_scores(df_mapped, compiled=compiled, with_components=True)
+    # Produits connus déjà recherchés pendant l'enrichissement : pas de seconde requête
+    missing = components.missing(df_mapped)
+    return df_mapped, df_final, missing, components
+
+
+def iter_enriched_chunks(source, chunksize=EXCEL_CHUNKSIZE, progress=None, compiled=None):
+    """Yield (raw chunk, mapped chunk, enriched chunk, missing mask, components) for each block of rows of an xlsx file."""
+    chunks = iter_excel_chunks(source, chunksize=chunksize, progress=progress)
+    while True:
+        # Lecture openpyxl mesurée bloc par bloc, à part du mapping et du scoring
+        with stage("iter_excel_chunks") as record:
+            chunk = next(chunks, None)
+            if record is not None and chunk is not None:
+                record.rows = len(chunk)
+        if chunk is None:
+            return
+        yield (chunk, *map_and_enrich(chunk, compiled=compiled))
+
+
+def _concat(frames):
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True)
+
+
+@timed()
+def process_excel(source, chunksize=EXCEL_CHUNKSIZE, progress=None, preview_rows=20, optimize=True, compiled=None):
+    """
+    Map and score an xlsx file block by block; only one raw block is in memory
+    at a time. With `optimize`, the assembled result gets compact dtypes.
+    Returns a ProcessedFile(preview, df_mapped, df_final, missing, memory, components).
+    """
+    # Mêmes critères pour tous les blocs, même si critere.json change en cours de lecture
+    compiled = get_loader().criteria if compiled is None else compiled
+    preview = None
+    mapped = []
+    final = []
+    missing = []
+    components = []
+    for chunk, df_mapped, df_final, chunk_missing, chunk_components in iter_enriched_chunks(source, chunksize, progress, compiled):
+        if preview is None:
+            preview = chunk.head(preview_rows).copy()
+        mapped.append(df_mapped)
+        final.append(df_final)
+        missing.append(chunk_missing)
+        components.append(chunk_components)
+    df_mapped = _concat(mapped)
+    # enrich_with_existing_scores complète df_mapped en place : ne pas le dupliquer
+    if all(m is f for m, f in zip(mapped, final)):
+        df_final = df_mapped
+    else:
+        df_final = _concat(final)
+    missing = np.concatenate(missing) if missing else np.zeros(0, dtype=bool)
+    components = ScoreComponents.concat(components) if components else None
+    memory = None
+    if optimize:
+        # Après la concaténation : des catégories par bloc redeviendraient du texte
+        df_mapped, memory = optimize_dtypes(df_mapped)
+        if df_final is not df_mapped:
+            df_final, _ = optimize_dtypes(df_final)
+    preview = preview if preview is not None else pd.DataFrame()
+    return ProcessedFile(preview, df_mapped, df_final, missing, memory, components)
+
+
+@timed()
+def refresh_scores(processed, compiled=None):
+    """
+    Update the scores of a ProcessedFile after critere.json or the reference
+    base changed; only the affected rows are recomputed (see rescore).
+    Returns the updated ProcessedFile (df_final is updated in place).
+    """
+    if processed.components is None:
+        return processed
+    df_final, components = rescore(processed.df_final, processed.components, compiled=compiled)
+    if components is processed.components:
+        return processed
+    return processed._replace(df_final=df_final, missing=components.missing(df_final), components=components)
@@ -0,0 +1,226 @@
+import contextlib
+import contextvars
+import functools
+import io
+import os
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Enregistreur actif (un par exécution du script Streamlit ou par lot), None sinon
+_current = contextvars.ContextVar("smartri_recorder", default=None)
+_depth = contextvars.ContextVar("smartri_stage_depth", default=0)
+
+PROFILE_ENGINES = ["cprofile", "pyinstrument"]
+
+
+def _rss_bytes():
+    """Resident memory of the process, None when it cannot be read."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    if resource is not None:
+        # Pic (et non valeur courante) : ko sous Linux, octets sous macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if os.uname().sysname == "Darwin" else peak * 1024
+    return None
+
+
+class StageRecord:
+    """Timing of one stage: wall time, rows processed and resident memory delta."""
+
+    __slots__ = ("name", "depth", "rows", "seconds", "memory_delta", "error")
+
+    def __init__(self, name, depth=0, rows=None):
+        self.name = name
+        self.depth = depth
+        self.rows = rows
+        self.seconds = None
+        self.memory_delta = None
+        self.error = None
+
+
+class Recorder:
+    """
+    Collects the stages run while it is active (`with recorder:` or
+    start()/stop()). Stages are recorded in the order they start, nested
+    stages with a larger depth.
+    """
+
+    def __init__(self):
+        self.records = []
+        self._token = None
+
+    def start(self):
+        self._token = _current.set(self)
+        return self
+
+    def stop(self):
+        if self._token is not None:
+            _current.reset(self._token)
+            self._token = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def to_frame(self):
+        """
+        One line per stage (name and depth); a stage run several times, e.g.
+        once per Excel block, is summed over its calls.
+        """
+        import pandas as pd
+
+        columns = ["Étape", "Appels", "Durée (s)", "Lignes", "Lignes/s", "Mémoire (Mo)", "Erreur"]
+        totals = {}
+        for r in self.records:
+            t = totals.setdefault((r.depth, r.name), {"calls": 0, "seconds": 0.0, "rows": None, "memory": None, "error": None})
+            t["calls"] += 1
+            t["seconds"] += r.seconds or 0.0
+            if r.rows is not None:
+                t["rows"] = (t["rows"] or 0) + r.rows
+            if r.memory_delta is not None:
+                t["memory"] = (t["memory"] or 0) + r.memory_delta
+            t["error"] = t["error"] or r.error
+        rows = [
+            [
+                "  " * depth + name,
+                t["calls"],
+                round(t["seconds"], 4),
+                t["rows"],
+                round(t["rows"] / t["seconds"]) if t["rows"] and t["seconds"] else None,
+                round(t["memory"] / 1e6, 1) if t["memory"] is not None else None,
+                t["error"],
+            ]
+            for (depth, name), t in totals.items()
+        ]
+        return pd.DataFrame(rows, columns=columns)
+
+
+def current_recorder():
+    return _current.get()
+
+
+@contextlib.contextmanager
+def stage(name, rows=None):
+    """
+    Time a block of code under `name`. Does nothing when no Recorder is active.
+    Yields the StageRecord (or None) so that `rows` can be set once known.
+    """
+    recorder = _current.get()
+    if recorder is None:
+        yield None
+        return
+    depth = _depth.get()
+    record = StageRecord(name, depth, rows)
+    recorder.records.append(record)
+    token = _depth.set(depth + 1)
+    rss = _rss_bytes()
+    start = time.perf_counter()
+    try:
+        yield record
+    except BaseException as e:
+        record.error = type(e).__name__
+        raise
+    finally:
+        record.seconds = time.perf_counter() - start
+        after = _rss_bytes()
+        if rss is not None and after is not None:
+            record.memory_delta = after - rss
+        _depth.reset(token)
+
+
+def _rows_of(value):
+    shape = getattr(value, "shape", None)
+    if shape:
+        return shape[0]
+    return None
+
+
+def timed(name=None):
+    """
+    Decorator recording each call as a stage (named after the function by
+    default). The rows are taken from the first argument's shape.
+    """
+    def decorator(func):
+        label = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _current.get() is None:
+                return func(*args, **kwargs)
+            with stage(label, rows=_rows_of(args[0]) if args else None):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class Profiler:
+    """
+    cProfile (standard library) or pyinstrument trace of a single run.
+    `dump()` returns the trace as bytes: pstats binary (.prof, for snakeviz or
+    pstats) for cProfile, an HTML page for pyinstrument.
+    """
+
+    def __init__(self, engine="cprofile"):
+        if engine not in PROFILE_ENGINES:
+            raise ValueError(f"Moteur de profilage inconnu : {engine}")
+        self.engine = engine
+        if engine == "pyinstrument":
+            try:
+                from pyinstrument import Profiler as _Pyinstrument
+            except ImportError as e:
+                raise ImportError("Le profilage pyinstrument nécessite pyinstrument (pip install pyinstrument).") from e
+            self._profiler = _Pyinstrument()
+        else:
+            import cProfile
+
+            self._profiler = cProfile.Profile()
+
+    @property
+    def extension(self):
+        return "html" if self.engine == "pyinstrument" else "prof"
+
+    def start(self):
+        if self.engine == "pyinstrument":
+            self._profiler.start()
+        else:
+            self._profiler.enable()
+        return self
+
+    def stop(self):
+        if self.engine == "pyinstrument":
+            self._profiler.stop()
+        else:
+            self._profiler.disable()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def dump(self):
+        if self.engine == "pyinstrument":
+            return self._profiler.output_html().encode("utf-8")
+        import marshal
+        import pstats
+
+        return marshal.dumps(pstats.Stats(self._profiler).stats)
+
+    def summary(self, limit=25):
+        """Text summary of the trace (functions sorted by cumulative time)."""
+        if self.engine == "pyinstrument":
+            return self._profiler.output_text()
+        import pstats
+
+        out = io.StringIO()
+        pstats.Stats(self._profiler, stream=out).sort_stats("cumulative").print_stats(limit)
+        return out.getvalue()
@@ -0,0 +1,335 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import Mapping
+
+import pandas as pd
+
+TABLE = "reference"
+# Taille maximale de la projection mémoire (mmap) de la base SQLite
+MMAP_SIZE = 256 * 1024 * 1024
+# Nombre de produits par requête "IN (...)" (limite de paramètres SQLite)
+LOOKUP_CHUNK = 900
+# Journal des produits écrits par révision (pour le re-scoring incrémental)
+CHANGES_DDL = 'CREATE TABLE IF NOT EXISTS changes (revision INTEGER, "Produit" TEXT)'
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _is_number(value):
+    if value is None or value == "":
+        return True
+    if isinstance(value, bool):
+        return False
+    try:
+        float(value)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+def _column_types(records):
+    """Column order of first appearance, REAL when every non-empty value parses as a number."""
+    columns = {}
+    for item in records:
+        for key, value in item.items():
+            numeric = columns.get(key, True)
+            columns[key] = numeric and key != "Produit" and _is_number(value)
+    return {key: ("REAL" if numeric else "TEXT") for key, numeric in columns.items()}
+
+
+def _typed(value, sql_type):
+    if value is None:
+        return None
+    if sql_type == "REAL":
+        if value == "":
+            return None
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return str(value)
+    return value if isinstance(value, str) else str(value)
+
+
+def migrate_from_json(json_path, db_path):
+    """
+    One-shot migration of the JSON reference file into an indexed SQLite store.
+    Numeric fields (stored as strings in the JSON) become REAL columns, empty
+    numeric values become NULL. The database is written to a temporary file and
+    moved into place, so readers never see a half-built store.
+    Returns the number of products written.
+    """
+    with open(json_path, encoding="utf-8") as f:
+        records = json.load(f)
+    types = _column_types(records)
+    types.setdefault("Produit", "TEXT")
+    columns = list(types)
+
+    tmp_path = f"{db_path}.tmp-{os.getpid()}"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    try:
+        column_defs = ", ".join(f"{_quote(c)} {types[c]}" for c in columns)
+        conn.execute(f"CREATE TABLE {TABLE} ({column_defs})")
+        conn.execute(f'CREATE UNIQUE INDEX idx_{TABLE}_produit ON {TABLE} ("Produit")')
+        conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+        conn.execute(CHANGES_DDL)
+        placeholders = ", ".join("?" for _ in columns)
+        # INSERT OR REPLACE : en cas de doublon, la dernière entrée gagne (comme l'ancien dict json_index)
+        conn.executemany(
+            f"INSERT OR REPLACE INTO {TABLE} ({', '.join(map(_quote, columns))}) VALUES ({placeholders})",
+            ([_typed(item.get(c), types[c]) for c in columns] for item in records),
+        )
+        conn.executemany(
+            "INSERT INTO meta (key, value) VALUES (?, ?)",
+            [
+                ("source_mtime", str(os.stat(json_path).st_mtime_ns)),
+                ("column_types", json.dumps(types, ensure_ascii=False)),
+                ("revision", "0"),
+                # Identifie cette construction : les révisions repartent de 0 à chaque migration
+                ("build", str(time.time_ns())),
+            ],
+        )
+        conn.commit()
+        count = conn.execute(f"SELECT COUNT(*) FROM {TABLE}").fetchone()[0]
+    finally:
+        conn.close()
+    os.replace(tmp_path, db_path)
+    return count
+
+
+class ReferenceStore(Mapping):
+    """
+    Access to the product reference base, backed by SQLite.
+
+    Behaves like the former `json_index` dict ({Produit: {champ: valeur}}) but
+    nothing is read at construction: the database is opened (memory-mapped) on
+    first use and rows are fetched on demand. When `json_path` is given and the
+    JSON file is newer than the store, the store is rebuilt from it first.
+    New products are written with `add_many`, which every reader of the same
+    database sees immediately.
+    """
+
+    def __init__(self, db_path, json_path=None):
+        self.db_path = db_path
+        self.json_path = json_path
+        self._conn = None
+        self._file = None
+        self._columns = None
+        self._lock = threading.RLock()
+
+    def __getstate__(self):
+        # Les connexions SQLite ne se partagent pas entre processus
+        state = self.__dict__.copy()
+        state["_conn"] = None
+        state["_lock"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+    def _is_stale(self):
+        if not os.path.exists(self.db_path):
+            return True
+        if not self.json_path or not os.path.exists(self.json_path):
+            return False
+        conn = sqlite3.connect(self.db_path)
+        try:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'source_mtime'").fetchone()
+        except sqlite3.DatabaseError:
+            return True
+        finally:
+            conn.close()
+        return row is None or int(row[0]) != os.stat(self.json_path).st_mtime_ns
+
+    def _file_id(self):
+        try:
+            stat = os.stat(self.db_path)
+        except OSError:
+            return None
+        return stat.st_dev, stat.st_ino
+
+    def _connection(self, lock_held=False):
+        with self._lock:
+            # Base reconstruite par un autre processus (fichier remplacé) : rouvrir le nouveau fichier
+            if self._conn is not None and self._file_id() != self._file:
+                self._conn.close()
+                self._conn = None
+            if self._conn is None:
+                if self._is_stale():
+                    if lock_held or not self.json_path:
+                        self._rebuild()
+                    else:
+                        from utils.add_reference import file_lock
+
+                        # Même verrou que les écritures : pas de reconstruction pendant un ajout
+                        with file_lock(f"{self.json_path}.lock"):
+                            self._rebuild()
+                self._file = self._file_id()
+                conn = sqlite3.connect(self.db_path, check_same_thread=False)
+                conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+                # Bases créées avant le journal des modifications
+                with conn:
+                    conn.execute(CHANGES_DDL)
+                self._columns = [r[1] for r in conn.execute(f"PRAGMA table_info({TABLE})")]
+                self._conn = conn
+            return self._conn
+
+    def _rebuild(self):
+        # Revérifié sous le verrou : un autre processus a pu reconstruire la base entre-temps
+        if self._is_stale():
+            migrate_from_json(self.json_path, self.db_path)
+
+    def open(self, lock_held=False):
+        """
+        Open the store now (building it from the JSON file if needed) instead of
+        on first lookup. `lock_held`: the caller already holds the JSON file lock.
+        """
+        self._connection(lock_held)
+        return self
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._connection().execute(sql, params).fetchall()
+
+    @property
+    def columns(self):
+        self._connection()
+        return list(self._columns)
+
+    @property
+    def version(self):
+        """Changes whenever the stored products change (rebuild or write): "build:revision"."""
+        rows = dict(self._query("SELECT key, value FROM meta WHERE key IN ('build', 'revision')"))
+        return f"{rows.get('build', '')}:{rows.get('revision', '0')}"
+
+    def changed_since(self, version):
+        """
+        Set of the products written after `version` (a previous value of
+        `version`), or None when it cannot be told: unknown version, or store
+        rebuilt since.
+        """
+        if version is None:
+            return None
+        build, _, revision = version.rpartition(":")
+        if build != self.version.rpartition(":")[0]:
+            return None
+        return {r[0] for r in self._query(
+            'SELECT DISTINCT "Produit" FROM changes WHERE revision > ?', (int(revision),)
+        )}
+
+    def _row_to_dict(self, row):
+        return {col: value for col, value in zip(self._columns, row) if value is not None}
+
+    def __getitem__(self, produit):
+        rows = self._query(f'SELECT * FROM {TABLE} WHERE "Produit" = ?', (produit,))
+        if not rows:
+            raise KeyError(produit)
+        return self._row_to_dict(rows[0])
+
+    def __contains__(self, produit):
+        if not isinstance(produit, str):
+            return False
+        return bool(self._query(f'SELECT 1 FROM {TABLE} WHERE "Produit" = ? LIMIT 1', (produit,)))
+
+    def __iter__(self):
+        return iter([r[0] for r in self._query(f'SELECT "Produit" FROM {TABLE}')])
+
+    def __len__(self):
+        return self._query(f"SELECT COUNT(*) FROM {TABLE}")[0][0]
+
+    def add_many(self, records, source_mtime=None):
+        """
+        Insert (or replace) products in one transaction. Unknown fields become new
+        columns. `source_mtime` records the JSON file the rows were also written
+        to, so that the store is not rebuilt from it on next open.
+        Returns the number of rows written.
+        """
+        records = [r for r in records if r.get("Produit") not in (None, "")]
+        if not records:
+            return 0
+        with self._lock:
+            conn = self._connection()
+            # Colonnes éventuellement ajoutées par un autre processus depuis l'ouverture
+            self._columns = [r[1] for r in conn.execute(f"PRAGMA table_info({TABLE})")]
+            row = conn.execute("SELECT value FROM meta WHERE key = 'column_types'").fetchone()
+            types = json.loads(row[0]) if row else {}
+            for col in self._columns:
+                types.setdefault(col, "TEXT")
+            with conn:
+                for col, sql_type in _column_types(records).items():
+                    if col not in types:
+                        conn.execute(f"ALTER TABLE {TABLE} ADD COLUMN {_quote(col)} {sql_type}")
+                        types[col] = sql_type
+                        self._columns.append(col)
+                placeholders = ", ".join("?" for _ in self._columns)
+                conn.executemany(
+                    f"INSERT OR REPLACE INTO {TABLE} ({', '.join(map(_quote, self._columns))}) VALUES ({placeholders})",
+                    ([_typed(item.get(c), types[c]) for c in self._columns] for item in records),
+                )
+                meta = [("column_types", json.dumps(types, ensure_ascii=False))]
+                if source_mtime is not None:
+                    meta.append(("source_mtime", str(source_mtime)))
+                conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", meta)
+                conn.execute(
+                    "UPDATE meta SET value = CAST(CAST(value AS INTEGER) + 1 AS TEXT) WHERE key = 'revision'"
+                )
+                revision = int(conn.execute("SELECT value FROM meta WHERE key = 'revision'").fetchone()[0])
+                conn.executemany(
+                    'INSERT INTO changes (revision, "Produit") VALUES (?, ?)',
+                    ((revision, str(item["Produit"])) for item in records),
+                )
+        return len(records)
+
+    def known(self, produits):
+        """Set of the given products that exist in the store (batched index lookups)."""
+        produits = [p for p in set(produits) if isinstance(p, str)]
+        found = set()
+        for start in range(0, len(produits), LOOKUP_CHUNK):
+            chunk = produits[start:start + LOOKUP_CHUNK]
+            placeholders = ", ".join("?" for _ in chunk)
+            found.update(r[0] for r in self._query(
+                f'SELECT "Produit" FROM {TABLE} WHERE "Produit" IN ({placeholders})', chunk
+            ))
+        return found
+
+    def lookup(self, produits, columns=None):
+        """
+        Fetch the reference rows of `produits` as a DataFrame indexed by Produit.
+        Requested columns that do not exist in the store are returned as all-NaN.
+        """
+        self._connection()
+        wanted = self._columns if columns is None else list(columns)
+        selected = [c for c in wanted if c in self._columns and c != "Produit"]
+        produits = [p for p in dict.fromkeys(produits) if isinstance(p, str)]
+        select = ", ".join(_quote(c) for c in ["Produit"] + selected)
+        rows = []
+        for start in range(0, len(produits), LOOKUP_CHUNK):
+            chunk = produits[start:start + LOOKUP_CHUNK]
+            placeholders = ", ".join("?" for _ in chunk)
+            rows.extend(self._query(
+                f'SELECT {select} FROM {TABLE} WHERE "Produit" IN ({placeholders})', chunk
+            ))
+        result = pd.DataFrame(rows, columns=["Produit"] + selected).set_index("Produit")
+        return result.reindex(columns=[c for c in wanted if c != "Produit"])
+
+
+if __name__ == "__main__":
+    # Migration manuelle : python -m utils.reference_store
+    from utils.data_loader import get_loader
+
+    loader = get_loader()
+    n = migrate_from_json(loader.reference_json_path, loader.reference_db_path)
+    print(f"{n} référence(s) migrée(s) vers {loader.reference_db_path}")
@@ -28,7 +28,7 @@ def enrich_and_score_dataframe(input_df):
             # Start with a copy of the input row
             enriched = copy.deepcopy(row.to_dict())
             # If product exists in reference, fill missing columns
-            ref = json_index.get(produit)
+            ref = get_loader().references.get(produit)
             if ref:
                 for col in required_cols:
                     if (col not in enriched or pd.isna(enriched.get(col))) and (ref.get(col, None) is not None):
@@ -50,151 +50,394 @@ def enrich_and_score_dataframe(input_df):
         error_df["Score Calculé"] = "Erreur"
         error_df["Catégorie"] = "Erreur"
         return error_df
-import json
 import pandas as pd
-import re
 from datetime import datetime
+from utils.criteria import parse_interval
+from utils.data_loader import get_loader
+from utils.dates import normalize_dates
+from utils.profiling import timed
 
-# Charger les critères de pondération (fallback)
-with open("data/critere.json", encoding="utf-8") as f:
-    criteria = json.load(f)
+DATE_CRITERION = "Date du dernier RI"
 
-# Charger la base de données des produits scorés
-with open("data/Planning_Inventaire_Integral_clean.json", encoding="utf-8") as f:
-    reference_data = json.load(f)
 
-# Indexer le JSON par produit
-json_index = {item["Produit"]: item for item in reference_data}
+def __getattr__(name):
+    # Aucune lecture de fichier à l'import : critères et base de référence sont
+    # fournis à la demande par le DataLoader (utils.data_loader)
+    if name == "json_index":
+        return get_loader().references
+    if name == "criteria":
+        return get_loader().criteria.raw
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-# --- Parse interval rules like "37 à 72 Jours", "< 20", ">=516 & <688"
-def parse_interval(condition):
-    condition = condition.strip()
 
-    if ">=" in condition and "<" in condition and "&" in condition:
-        match = re.findall(r"\d+", condition)
-        if len(match) == 2:
-            a, b = map(float, match)
-            return lambda v: float(a) <= float(v) < float(b)
+def get_pond_and_coeff(value, critere):
+    compiled = get_loader().criteria
+    if critere not in compiled:
+        return 0, 0
+    c = compiled[critere]
+    i = c.spec_indices(pd.Series([value], dtype=object))[0]
+    if i == c.n_specs:
+        return 0, 0
+    return c.raw["Spécifications"][i]["Pondération"], c.raw["Coefficient"]
 
-    if "à" in condition:
-        match = re.findall(r"\d+", condition)
-        if len(match) == 2:
-            a, b = map(float, match)
-            return lambda v: a <= float(v) <= b
 
-    if condition.startswith(">="):
-        match = re.findall(r"\d+", condition)
-        if match:
-            return lambda v: float(v) >= float(match[0])
+def _days_since(series, today):
+    # Colonne déjà normalisée en amont (utils.dates) : pas de conversion cellule par cellule
+    days = (today - normalize_dates(series)).dt.days
+    return days.fillna(0)
 
-    if condition.startswith("<"):
-        match = re.findall(r"\d+", condition)
-        if match:
-            return lambda v: float(v) < float(match[0])
 
-    if condition.startswith(">"):
-        match = re.findall(r"\d+", condition)
-        if match:
-            return lambda v: float(v) > float(match[0])
+def _today():
+    return pd.Timestamp(datetime.today().date())
 
-    return lambda v: str(v).strip().lower() == condition.strip().lower()
 
+def _criterion_match(df, c, today):
+    """(present mask, scored values, specification indices) of criterion `c`, None if df lacks its column."""
+    if c.name not in df.columns:
+        return None
+    column = df[c.name]
+    present = column.notna().to_numpy()
+    values = column[present]
 
-def get_pond_and_coeff(value, critere):
-    for c in criteria:
-        if c["Critère"] == critere:
-            for spec in c["Spécifications"]:
-                try:
-                    if parse_interval(spec["Spécification"])(value):
-                        return spec["Pondération"], c["Coefficient"]
-                except:
-                    continue
-    return 0, 0
-
-
-def calculate_scores(df):
-    scores = []
-    categories = []
-    statuts = []
-    today = pd.Timestamp(datetime.today().date())
-
-    for idx, row in df.iterrows():
-        total = 0
-        debug_info = []
-        for c in criteria:
-            crit = c["Critère"]
-            if crit in row and pd.notna(row[crit]):
-                value = row[crit]
-
-                # Si le critère est une date → convertir en nombre de jours
-                if crit == "Date du dernier RI":
-                    try:
-                        delta = (today - pd.to_datetime(value)).days
-                        value = delta
-                    except Exception as e:
-                        debug_info.append(f"[Row {idx}] Failed to parse date for '{crit}': {value} ({e})")
-                        value = 0
-
-                pond, coeff = get_pond_and_coeff(value, crit)
-                debug_info.append(f"[Row {idx}] Critère: {crit}, Value: {value}, Pondération: {pond}, Coefficient: {coeff}, Contribution: {pond * coeff}")
-                total += pond * coeff
-            else:
-                debug_info.append(f"[Row {idx}] Critère: {crit} not found or NaN in row.")
-
-        print(f"[Row {idx}] Total Score: {total}")
-        for info in debug_info:
-            print(info)
-
-        scores.append(round(total, 2))
-        # Catégorie
-        if total >= 16:
-            categories.append("Haut")
-        elif total >= 13:
-            categories.append("Moyen")
-        elif total > 0:
-            categories.append("Bas")
-        else:
-            categories.append("Non pondéré")
-        # Statut Inventaire
-        if total <= 10:
-            statuts.append("Urgent")
-        elif total < 16:
-            statuts.append("Normal")
-        else:
-            statuts.append("Safe")
+    # Si le critère est une date → convertir en nombre de jours
+    if c.name == DATE_CRITERION:
+        values = _days_since(values, today)
 
-    df["Score Calculé"] = scores
-    df["Catégorie"] = categories
-    df["Statut Inventaire"] = statuts
+    return present, values, c.spec_indices(values)
+
+
+def _criterion_matches(df, compiled, today):
+    """Yield (criterion, present mask, scored values, specification indices) per criterion found in df."""
+    for c in compiled:
+        match = _criterion_match(df, c, today)
+        if match is not None:
+            yield (c, *match)
+
+
+def _spec_column(df, c, today):
+    # -1 : valeur absente (pondération 0, comme une spécification sans correspondance)
+    column = np.full(len(df), -1, dtype=np.int16)
+    match = _criterion_match(df, c, today)
+    if match is not None:
+        present, _, idx = match
+        column[present] = idx
+    return column
+
+
+def _spec_matrix(df, compiled, today):
+    """Matched specification index per row and criterion (rows × criteria, int16)."""
+    matrix = np.empty((len(df), len(compiled)), dtype=np.int16)
+    for j, c in enumerate(compiled):
+        matrix[:, j] = _spec_column(df, c, today)
+    return matrix
+
+
+def _totals(matrix, compiled):
+    # Même ordre d'addition que critère par critère : résultats identiques au bit près
+    total = np.zeros(len(matrix))
+    for j, c in enumerate(compiled):
+        total += c.ponds[matrix[:, j]] * c.coefficient
+    return total
+
+
+def _rounded(total):
+    # round() par valeur distincte pour rester identique à l'arrondi Python
+    uniques, inverse = np.unique(total, return_inverse=True)
+    return np.array([round(float(u), 2) for u in uniques])[inverse] if len(total) else total
+
+
+def _categories(total):
+    return np.select(
+        [total >= 16, total >= 13, total > 0], ["Haut", "Moyen", "Bas"], default="Non pondéré"
+    )
+
+
+@timed()
+def calculate_scores(df, compiled=None):
+    compiled = get_loader().criteria if compiled is None else compiled
+    total = _totals(_spec_matrix(df, compiled, _today()), compiled)
+    df["Score Calculé"] = _rounded(total)
+    df["Catégorie"] = _categories(total)
+    df["Statut Inventaire"] = _statuts(total)
     return df
 
 
-# --- Fonction principale utilisée par l’app
-def enrich_with_existing_scores(df):
-    scores = []
-    categories = []
-
-    statuts = []
-    for _, row in df.iterrows():
-        produit = str(row.get("Produit", "")).strip()
-        if produit in json_index:
-            data = json_index[produit]
-            score_val = data.get("Score total", 0)
-            cat_val = data.get("Catégorie", "Non pondéré")
-        else:
-            fallback = calculate_scores(pd.DataFrame([row.copy()]))
-            score_val = fallback["Score Calculé"].iloc[0]
-            cat_val = fallback["Catégorie"].iloc[0]
-        scores.append(score_val)
-        categories.append(cat_val)
-        # Always compute status from score
-        if score_val <= 10:
-            statuts.append("Urgent")
-        elif score_val < 16:
-            statuts.append("Normal")
-        else:
-            statuts.append("Safe")
+def explain_scores(df, rows=None, compiled=None):
+    """
+    Per-row, per-criterion breakdown of the score, for inspecting a few rows.
+    Args:
+        df: DataFrame with the criteria columns
+        rows: optional index labels to restrict the explanation to
+        compiled: CompiledCriteria to use (defaults to data/critere.json)
+    Returns:
+        Long DataFrame with one line per (row, criterion): Ligne, Critère, Valeur,
+        Spécification, Pondération, Coefficient, Contribution
+    """
+    compiled = get_loader().criteria if compiled is None else compiled
+    if rows is not None:
+        df = df.loc[rows]
+    today = _today()
+
+    parts = []
+    for order, (c, present, values, idx) in enumerate(_criterion_matches(df, compiled, today)):
+        matched = idx < c.n_specs
+        ponds = c.ponds[idx]
+        coeffs = np.where(matched, c.coefficient, 0.0)
+        parts.append(pd.DataFrame({
+            "Position": np.flatnonzero(present),
+            "Ordre": order,
+            "Ligne": df.index[present],
+            "Critère": c.name,
+            "Valeur": values.to_numpy(),
+            "Spécification": [c.labels[i] if i < c.n_specs else None for i in idx],
+            "Pondération": ponds,
+            "Coefficient": coeffs,
+            "Contribution": ponds * coeffs,
+        }))
+    columns = ["Ligne", "Critère", "Valeur", "Spécification", "Pondération", "Coefficient", "Contribution"]
+    if not parts:
+        return pd.DataFrame(columns=columns)
+    explained = pd.concat(parts, ignore_index=True)
+    explained = explained.sort_values(["Position", "Ordre"], kind="stable")
+    return explained[columns].reset_index(drop=True)
+
+
+def _statuts(scores):
+    return np.select([scores <= 10, scores < 16], ["Urgent", "Normal"], default="Safe")
+
+
+def _produit_keys(df):
+    if "Produit" in df.columns:
+        return df["Produit"].astype(str).str.strip()
+    return pd.Series("", index=df.index)
+
+
+class ScoreComponents:
+    """
+    What the scores of an enriched frame were built from, kept so that they can
+    be brought up to date by `rescore` instead of re-enriching the whole frame.
+
+    `indices` holds, per row and criterion, the matched specification (int16;
+    -1 for a missing value, n_specs when nothing matches). It is filled for the
+    `computed` rows, the products scored with critere.json; `known` marks the
+    rows whose score comes from the reference base. `names` and `conditions`
+    describe the criteria at scoring time, and the versions and day tell what
+    the scores depend on.
+    """
+
+    def __init__(self, names, conditions, indices, known, computed, criteria_version, reference_version, today):
+        self.names = names
+        self.conditions = conditions
+        self.indices = indices
+        self.known = known
+        self.computed = computed
+        self.criteria_version = criteria_version
+        self.reference_version = reference_version
+        self.today = today
+
+    def __len__(self):
+        return len(self.known)
+
+    @classmethod
+    def concat(cls, parts):
+        """Components of frames scored block by block, in block order."""
+        first = parts[0]
+        for part in parts[1:]:
+            if (part.names, part.conditions) != (first.names, first.conditions):
+                raise ValueError("Blocs scorés avec des critères différents")
+
+        def common(attr):
+            # Versions différentes d'un bloc à l'autre : inconnue, tout sera revérifié
+            values = {getattr(p, attr) for p in parts}
+            return values.pop() if len(values) == 1 else None
+
+        return cls(
+            first.names,
+            first.conditions,
+            np.concatenate([p.indices for p in parts]),
+            np.concatenate([p.known for p in parts]),
+            np.concatenate([p.computed for p in parts]),
+            common("criteria_version"),
+            common("reference_version"),
+            min(p.today for p in parts),
+        )
+
+    def contributions(self, compiled=None):
+        """Pondération × coefficient per row and criterion (0 where not computed)."""
+        compiled = get_loader().criteria if compiled is None else compiled
+        if [c.name for c in compiled] != self.names or [_conditions(c) for c in compiled] != self.conditions:
+            raise ValueError("Critères différents de ceux du scoring : appeler rescore d'abord")
+        values = np.zeros((len(self), len(compiled)))
+        for j, c in enumerate(compiled):
+            values[:, j] = c.ponds[self.indices[:, j]] * c.coefficient
+        values[~self.computed] = 0
+        return pd.DataFrame(values, columns=self.names)
+
+    def missing(self, df):
+        """Boolean array: rows with a non-empty Produit that is not in the reference base."""
+        return (_produit_keys(df) != "").to_numpy() & ~self.known
+
+
+def _conditions(c):
+    return tuple(c.labels)
+
+
+def _new_components(compiled, indices, known, computed, reference_version, today):
+    return ScoreComponents(
+        [c.name for c in compiled],
+        [_conditions(c) for c in compiled],
+        indices,
+        known,
+        computed,
+        compiled.version,
+        reference_version,
+        today,
+    )
+
+
+def _reference_scores(references, produits):
+    # Jointure sur l'index, une recherche par produit distinct
+    refs = references.lookup(produits.unique(), columns=["Score total", "Catégorie"])
+    return (
+        produits.map(refs["Score total"].fillna(0)).to_numpy(),
+        produits.map(refs["Catégorie"].fillna("Non pondéré")).to_numpy(),
+    )
+
+
+def _assign_scores(df, scores, categories):
+    scores = pd.Series(scores, index=df.index).infer_objects()
     df["Score Calculé"] = scores
     df["Catégorie"] = categories
-    df["Statut Inventaire"] = statuts
-    return df
+    # Always compute status from score
+    df["Statut Inventaire"] = _statuts(scores.to_numpy())
+
+
+# --- Fonction principale utilisée par l’app
+@timed()
+def enrich_with_existing_scores(df, compiled=None, with_components=False):
+    """
+    Reuse the stored score of products already in json_index and score all the
+    other rows in one vectorized pass (with `compiled` criteria if given).
+    Results are merged by position. With `with_components`, returns
+    (df, ScoreComponents) so that the scores can later be updated by `rescore`.
+    """
+    loader = get_loader()
+    compiled = loader.criteria if compiled is None else compiled
+    references = loader.references
+    # Version lue avant les recherches : un ajout concurrent sera revu par rescore
+    reference_version = references.version
+    today = _today()
+    produits = _produit_keys(df)
+    known = produits.isin(references.known(produits.unique())).to_numpy()
+
+    scores = np.empty(len(df), dtype=object)
+    categories = np.empty(len(df), dtype=object)
+
+    if known.any():
+        scores[known], categories[known] = _reference_scores(references, produits[known])
+
+    # Produits inconnus : un seul calcul de score pour toutes les lignes
+    matrix = None
+    if not known.all():
+        matrix = _spec_matrix(df if not known.any() else df.loc[~known], compiled, today)
+        total = _totals(matrix, compiled)
+        scores[~known] = _rounded(total)
+        categories[~known] = _categories(total)
+
+    _assign_scores(df, scores, categories)
+    if not with_components:
+        return df
+    indices = np.full((len(df), len(compiled)), -1, dtype=np.int16)
+    if matrix is not None:
+        indices[~known] = matrix
+    return df, _new_components(compiled, indices, known, ~known, reference_version, today)
+
+
+@timed()
+def rescore(df, components, compiled=None):
+    """
+    Bring the scores of a frame enriched with `with_components` up to date with
+    the current critere.json and reference base, recomputing only what changed.
+    Criteria: specification columns are reused for every criterion whose
+    specifications are unchanged (the date criterion only on the same day), and
+    the totals are summed again from the stored pondérations, so a coefficient
+    change costs one vectorized pass. Reference base: only the rows whose
+    Produit was added or changed since `components` are looked up again (all
+    rows after a rebuild of the store).
+    Returns (df, components), df updated in place; `components` is returned
+    as is when nothing changed.
+    """
+    if len(df) != len(components):
+        raise ValueError("Le tableau ne correspond pas aux composantes de score")
+    loader = get_loader()
+    compiled = loader.criteria if compiled is None else compiled
+    references = loader.references
+    reference_version = references.version
+    today = _today()
+    criteria_changed = compiled.version is None or compiled.version != components.criteria_version
+    day_changed = today != components.today and DATE_CRITERION in compiled
+    if not criteria_changed and not day_changed and reference_version == components.reference_version:
+        return df, components
+
+    known = components.known.copy()
+    produits = None
+    from_references = np.zeros(len(df), dtype=bool)
+    if reference_version != components.reference_version:
+        changed = references.changed_since(components.reference_version)
+        produits = _produit_keys(df)
+        candidates = produits.isin(changed).to_numpy() if changed is not None else np.ones(len(df), dtype=bool)
+        if candidates.any():
+            candidate_produits = produits[candidates]
+            now_known = candidate_produits.isin(references.known(candidate_produits.unique())).to_numpy()
+            known[candidates] = now_known
+            from_references[candidates] = now_known
+
+    target = ~known
+    # Lignes devenues inconnues sans composantes (après une reconstruction de la base)
+    stale = target & ~components.computed
+    indices = components.indices
+    # Composantes tenues à jour pour les seules lignes scorées avec les critères
+    computed = target
+    if criteria_changed or day_changed or stale.any():
+        old = {name: j for j, name in enumerate(components.names)}
+        indices = np.full((len(df), len(compiled)), -1, dtype=np.int16)
+        subsets = {}
+        for j, c in enumerate(compiled):
+            jo = old.get(c.name)
+            reusable = (
+                jo is not None
+                and components.conditions[jo] == _conditions(c)
+                and not (c.name == DATE_CRITERION and today != components.today)
+            )
+            if reusable:
+                indices[:, j] = components.indices[:, jo]
+                rows = stale
+            else:
+                rows = target
+            if rows.any():
+                key = "stale" if rows is stale else "target"
+                if key not in subsets:
+                    subsets[key] = df.iloc[np.flatnonzero(rows)]
+                indices[rows, j] = _spec_column(subsets[key], c, today)
+
+    rescored = target if criteria_changed or day_changed else stale
+    if from_references.any() or rescored.any():
+        categorical = [
+            col for col in ["Catégorie", "Statut Inventaire"]
+            if col in df.columns and isinstance(df[col].dtype, pd.CategoricalDtype)
+        ]
+        scores = df["Score Calculé"].to_numpy(dtype=object, copy=True)
+        categories = df["Catégorie"].to_numpy(dtype=object, copy=True)
+        if from_references.any():
+            scores[from_references], categories[from_references] = _reference_scores(
+                references, produits[from_references]
+            )
+        if rescored.any():
+            total = _totals(indices[rescored], compiled)
+            scores[rescored] = _rounded(total)
+            categories[rescored] = _categories(total)
+        _assign_scores(df, scores, categories)
+        for col in categorical:
+            df[col] = df[col].astype("category")
+
+    return df, _new_components(compiled, indices, known, computed, reference_version, today)